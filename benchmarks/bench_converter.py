@@ -0,0 +1,124 @@
+"""Converter throughput benchmark over synthetic contexts.
+
+    python benchmarks/bench_converter.py --sizes 10,100,1000,10000,100000 --json results.json
+    python benchmarks/bench_converter.py --sizes 10,100,1000 --compare results.json
+    python benchmarks/bench_converter.py --sizes 100 --depth 10,100,1000 --json depth.json
+
+Elements/s should not drop with the nesting depth: routes are translated with an explicit stack, deep routes cost
+neither python frames nor quadratic copies.
+
+Every size is converted in a fresh interpreter so the reported peak RSS belongs to that size only.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import DEFAULT_MIX, generate
+
+DEFAULT_SIZES = '10,100,1000,10000,100000'
+DEFAULT_DEPTH = 3
+
+
+def peak_rss_mb():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def measure(path, repeat, extra_args):
+    """Runs inside the child interpreter, prints the timings as json."""
+    from xml2dsl.xml2dsl import Converter, build_arg_parser
+
+    options = build_arg_parser().parse_args(['--quiet'] + extra_args)
+    timings = []
+    with open(os.devnull, "w") as devnull:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            Converter(options).convert(path, devnull)
+            timings.append(time.perf_counter() - start)
+    print(json.dumps({'seconds': min(timings), 'peak_rss_mb': peak_rss_mb()}))
+
+
+def run_size(routes, depth, args, workdir):
+    path = os.path.join(workdir, f'synthetic-{routes}-{depth}.xml')
+    elements = generate(path, routes=routes, depth=depth, mix=args.mix, groovy=args.groovy, beans=args.beans)
+    repeat = args.repeat if routes <= 10000 else 1
+    command = [sys.executable, os.path.abspath(__file__), '--measure', path, '--repeat', str(repeat), '--']
+    output = subprocess.run(command + args.converter_args, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.splitlines()[-1])
+    seconds = result['seconds']
+    return {
+        'routes': routes,
+        'depth': depth,
+        'elements': elements,
+        'mb': round(os.path.getsize(path) / (1024 * 1024), 3),
+        'seconds': round(seconds, 6),
+        'files_per_s': round(1 / seconds, 3),
+        'elements_per_s': round(elements / seconds, 1),
+        'peak_rss_mb': round(result['peak_rss_mb'], 1)
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, "r") as baseline_file:
+        # results older than --depth lists were all run at the default depth
+        baseline = {(r['routes'], r.get('depth', DEFAULT_DEPTH)): r for r in json.load(baseline_file)['results']}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['routes'], result['depth']))
+        if previous and result['elements_per_s'] < previous['elements_per_s'] * (1 - tolerance):
+            regressions.append(f"{result['routes']} routes, depth {result['depth']}: {result['elements_per_s']} "
+                               f"elements/s, baseline {previous['elements_per_s']}")
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks the xml2dsl Converter on synthetic contexts")
+    p.add_argument('--sizes', type=str, default=DEFAULT_SIZES, help='comma separated route counts')
+    p.add_argument('--depth', type=str, default=str(DEFAULT_DEPTH),
+                   help='comma separated nesting depths, every size runs at every depth')
+    p.add_argument('--mix', type=str, default=DEFAULT_MIX)
+    p.add_argument('--groovy', type=int, default=10)
+    p.add_argument('--beans', type=int, default=10)
+    p.add_argument('--repeat', type=int, default=3, help='best of n runs (sizes up to 10k routes)')
+    p.add_argument('--json', type=str, help='write the results to this file')
+    p.add_argument('--compare', type=str, help='fail when elements/s drops below a previous --json result')
+    p.add_argument('--tolerance', type=float, default=0.2, help='allowed elements/s drop for --compare')
+    p.add_argument('--measure', type=str, help=argparse.SUPPRESS)
+    p.add_argument('converter_args', nargs='*', help='extra converter options after --, e.g. -- --stream')
+    args = p.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.repeat, args.converter_args)
+        return 0
+
+    results = []
+    print(f"{'routes':>8} {'depth':>6} {'elements':>10} {'MB':>8} {'seconds':>9} {'files/s':>9} {'elements/s':>12} "
+          f"{'RSS MB':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for routes in [int(size) for size in args.sizes.split(',')]:
+            for depth in [int(depth) for depth in args.depth.split(',')]:
+                r = run_size(routes, depth, args, workdir)
+                results.append(r)
+                print(f"{r['routes']:>8} {r['depth']:>6} {r['elements']:>10} {r['mb']:>8} {r['seconds']:>9.3f} "
+                      f"{r['files_per_s']:>9.2f} {r['elements_per_s']:>12.0f} {r['peak_rss_mb']:>8}", flush=True)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({'converter_args': args.converter_args, 'results': results}, json_file, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print("regression:", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
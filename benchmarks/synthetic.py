@@ -0,0 +1,197 @@
+"""Synthetic spring / camel xml context generator for the benchmarks.
+
+    python benchmarks/synthetic.py --routes 1000 --depth 4 --mix choice=3,split=1,doTry=1 --output ctx.xml
+"""
+import argparse
+import random
+import sys
+from xml.sax.saxutils import quoteattr
+
+CONSTRUCTS = ('choice', 'split', 'doTry', 'multicast', 'onException')
+DEFAULT_MIX = 'choice=3,split=2,doTry=2,multicast=1,onException=1'
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in CONSTRUCTS:
+            raise ValueError(f'unknown construct {name}, expected one of {", ".join(CONSTRUCTS)}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class ContextGenerator:
+    """Writes a camel context with ``routes`` routes, every route nests ``depth`` constructs picked from ``mix``.
+
+    Only the first branch of a construct goes one level deeper, so the element count grows linearly with the
+    depth. ``onException`` picks become context level error handlers placed before the route.
+    """
+
+    def __init__(self, routes=100, depth=3, mix=DEFAULT_MIX, groovy=10, beans=10, seed=0):
+        self.routes = routes
+        self.depth = depth
+        self.mix = parse_mix(mix) if isinstance(mix, str) else dict(mix)
+        self.groovy = groovy
+        self.beans = beans
+        self.random = random.Random(seed)
+        self.elements = 0
+        self.out = None
+
+    def write(self, out):
+        """Write the document to the text stream out, returns the number of elements written."""
+        self.out = out
+        self.elements = 0
+        self.line(0, '<?xml version="1.0" encoding="UTF-8"?>')
+        self.open(0, 'beans xmlns="http://www.springframework.org/schema/beans"')
+        for idx in range(self.beans):
+            self.leaf(1, f'bean id="bean{idx}" class="com.example.synthetic.Bean{idx}"')
+        self.open(1, 'camelContext id="synthetic" xmlns="http://camel.apache.org/schema/spring"')
+
+        constructs = [name for name in CONSTRUCTS if name != 'onException' and self.mix.get(name)]
+        weights = [self.mix[name] for name in constructs]
+        for idx in range(self.routes):
+            nested = []
+            for level in range(self.depth):
+                construct = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+                if construct == 'onException':
+                    self.on_exception(2, idx, level)
+                    if not constructs:
+                        continue
+                    construct = self.random.choices(constructs, weights=weights)[0]
+                nested.append(construct)
+            self.route(2, idx, nested)
+
+        self.close(1, 'camelContext')
+        self.close(0, 'beans')
+        return self.elements
+
+    def route(self, level, idx, nested):
+        self.open(level, f'route id="route{idx}"')
+        self.leaf(level + 1, f'from uri="direct:route{idx}"')
+        every = max(1, self.routes // self.groovy) if self.groovy else 0
+        if every and idx % every == 0 and idx // every < self.groovy:
+            self.expression(level + 1, 'setBody', 'groovy', f'def value = request.body\nreturn value + "{idx}"')
+        self.steps(level + 1, idx, nested)
+        self.close(level, 'route')
+
+    def steps(self, level, idx, nested):
+        """Steps of a route with the nested constructs, written without recursion: every construct is a generator
+        writing its opening tags, yielding the level of its nested steps and writing its closing tags."""
+        opened = []
+        for construct in nested:
+            self.step_head(level, idx)
+            block = getattr(self, construct)(level, idx)
+            opened.append((level, block))
+            level = next(block)
+        self.step_head(level, idx)
+        self.leaf(level, f'to uri="direct:route{(idx + 1) % self.routes}"')
+        for level, block in reversed(opened):
+            next(block, None)
+            self.leaf(level, f'to uri="direct:route{(idx + 1) % self.routes}"')
+
+    def step_head(self, level, idx):
+        self.leaf(level, f'log message={quoteattr(f"route {idx} ${{header.operation}} ${{property.step}}")}')
+        self.expression(level, 'setHeader name="operation"', 'simple', '${header.operation}-' + str(idx))
+        if self.beans:
+            self.leaf(level, f'bean ref="bean{self.random.randrange(self.beans)}" method="process"')
+
+    def choice(self, level, idx):
+        self.open(level, 'choice')
+        self.open(level + 1, 'when')
+        self.line(level + 2, f'<simple>${{header.operation}} == \'{idx}\'</simple>')
+        self.elements += 1
+        yield level + 2
+        self.close(level + 1, 'when')
+        self.open(level + 1, 'otherwise')
+        self.leaf(level + 2, 'log message="otherwise" loggingLevel="DEBUG"')
+        self.close(level + 1, 'otherwise')
+        self.close(level, 'choice')
+
+    def split(self, level, idx):
+        self.open(level, 'split streaming="true"')
+        self.leaf(level + 1, 'tokenize token=","')
+        yield level + 1
+        self.close(level, 'split')
+
+    def doTry(self, level, idx):
+        self.open(level, 'doTry')
+        yield level + 1
+        self.open(level + 1, 'doCatch')
+        self.expression(level + 2, 'exception', None, 'java.lang.IllegalStateException')
+        self.leaf(level + 2, 'log message="caught ${exception.message}" loggingLevel="WARN"')
+        self.close(level + 1, 'doCatch')
+        self.open(level + 1, 'doFinally')
+        self.leaf(level + 2, 'log message="finally"')
+        self.close(level + 1, 'doFinally')
+        self.close(level, 'doTry')
+
+    def multicast(self, level, idx):
+        self.open(level, 'multicast')
+        yield level + 1
+        self.leaf(level + 1, f'to uri="seda:audit{idx}"')
+        self.close(level, 'multicast')
+
+    def on_exception(self, level, idx, depth):
+        self.open(level, 'onException')
+        self.expression(level + 1, 'exception', None, f'com.example.synthetic.Route{idx}Level{depth}Exception')
+        self.expression(level + 1, 'handled', 'constant', 'true')
+        self.leaf(level + 1, 'log message="failed ${exception.message}" loggingLevel="ERROR"')
+        self.leaf(level + 1, 'to uri="direct:errors"')
+        self.close(level, 'onException')
+
+    def expression(self, level, tag, language, text):
+        name = tag.partition(' ')[0]
+        if language is None:
+            self.line(level, f'<{tag}>{text}</{name}>')
+            self.elements += 1
+            return
+        self.open(level, tag)
+        self.line(level + 1, f'<{language}>{text}</{language}>')
+        self.elements += 1
+        self.close(level, name)
+
+    def open(self, level, tag):
+        self.line(level, f'<{tag}>')
+        self.elements += 1
+
+    def close(self, level, name):
+        self.line(level, f'</{name}>')
+
+    def leaf(self, level, tag):
+        self.line(level, f'<{tag}/>')
+        self.elements += 1
+
+    def line(self, level, text):
+        self.out.write('    ' * min(level, 64) + text + '\n')
+
+
+def generate(path, **kwargs):
+    """Write a synthetic context to path, returns the number of elements."""
+    with open(path, "w") as out:
+        return ContextGenerator(**kwargs).write(out)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Generates synthetic camel xml contexts")
+    p.add_argument('--routes', type=int, default=100)
+    p.add_argument('--depth', type=int, default=3, help='nested constructs per route')
+    p.add_argument('--mix', type=str, default=DEFAULT_MIX,
+                   help=f'construct weights, any of {", ".join(CONSTRUCTS)}')
+    p.add_argument('--groovy', type=int, default=10, help='number of groovy blocks')
+    p.add_argument('--beans', type=int, default=10, help='number of beans')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--output', type=str, help='defaults to stdout')
+    args = p.parse_args()
+
+    options = dict(routes=args.routes, depth=args.depth, mix=args.mix, groovy=args.groovy, beans=args.beans,
+                   seed=args.seed)
+    if args.output:
+        elements = generate(args.output, **options)
+    else:
+        elements = ContextGenerator(**options).write(sys.stdout)
+    print(f'{elements} elements', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
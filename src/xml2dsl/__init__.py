@@ -1,2 +1,6 @@
-import importlib.metadata
-__version__ = importlib.metadata.version('camel-xml2dsl')
\ No newline at end of file
+def __getattr__(name):
+    # resolved on demand, reading the distribution metadata slows down every import
+    if name == '__version__':
+        from xml2dsl.xml2dsl import version
+        return version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
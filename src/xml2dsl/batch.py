@@ -0,0 +1,188 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import glob
+import json
+import os
+import time
+
+from xml2dsl.xml2dsl import ARCHIVE_SEPARATOR, ARCHIVE_SUFFIXES, NORMAL, Converter, console, log_level
+from xml2dsl.yaml_dsl import YamlEmitter
+
+# suffix of the file written for every --target
+TARGET_SUFFIXES = {'java': '.java', 'yaml': YamlEmitter.SUFFIX}
+
+# archive entries are only converted when they mention it, jars hold many other xml files (poms, descriptors...)
+CONTEXT_MARKER = b'camelContext'
+
+
+def declares_context(archive, info):
+    with archive.open(info) as entry:
+        tail = b''
+        while True:
+            chunk = entry.read(1 << 16)
+            if not chunk:
+                return False
+            if CONTEXT_MARKER in tail + chunk:
+                return True
+            tail = chunk[-len(CONTEXT_MARKER):]
+
+
+def archive_entries(path):
+    """The xml entries of a .jar/.war/.zip declaring a camelContext, as archive!/entry paths."""
+    import zipfile
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return [path + ARCHIVE_SEPARATOR + info.filename for info in archive.infolist()
+                    if not info.is_dir() and info.filename.endswith('.xml') and declares_context(archive, info)]
+    except zipfile.BadZipFile:
+        console.log("not a zip archive", path, style="red")
+        return []
+
+
+def expand(path):
+    """Input paths of a file: itself for .xml and .xml.gz files, its entries for archives."""
+    if path.endswith(ARCHIVE_SUFFIXES):
+        return archive_entries(path)
+    return [path]
+
+
+def output_name(name):
+    """Relative output path of an input without the target suffix, app.war!/WEB-INF/context.xml ->
+    app.war/WEB-INF/context."""
+    name = name.replace(ARCHIVE_SEPARATOR, os.sep)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+def collect_inputs(args):
+    """Resolve --xml-dir, --glob and --xml-list into (path, output name) pairs."""
+    inputs = {}
+
+    if args.xml_dir:
+        for directory, _, files in os.walk(args.xml_dir):
+            for file_name in sorted(files):
+                if file_name.endswith(('.xml', '.xml.gz') + ARCHIVE_SUFFIXES):
+                    for path in expand(os.path.join(directory, file_name)):
+                        inputs[path] = os.path.relpath(path, args.xml_dir)
+
+    listed = []
+    if args.glob:
+        listed += [path for path in sorted(glob.glob(args.glob, recursive=True)) if os.path.isfile(path)]
+
+    if args.xml_list:
+        with open(args.xml_list, "r") as xml_list:
+            for line in xml_list:
+                path = line.strip()
+                if path and not path.startswith('#'):
+                    listed.append(path)
+
+    listed = [entry for path in listed for entry in expand(path)]
+    if listed:
+        # outputs keep the layout of the inputs below their common directory
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in listed])
+        for path in listed:
+            inputs.setdefault(path, os.path.relpath(os.path.abspath(path), root))
+
+    return [(path, output_name(name)) for path, name in inputs.items()]
+
+
+def convert_file(xml_path, output_path, options):
+    """Worker entry point, every file gets a fresh Converter translating it once for all the targets, output_path +
+    the target suffix being written for each."""
+    start = time.perf_counter()
+    converter = Converter(options)
+    outputs = []
+    try:
+        if converter.checking:
+            errors = converter.check(xml_path)['errors']
+            error = f'{errors} unsupported elements or unresolved references' if errors else None
+        else:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            with contextlib.ExitStack() as files:
+                streams = {}
+                for target in converter.targets:
+                    outputs.append(output_path + TARGET_SUFFIXES[target])
+                    streams[target] = files.enter_context(open(outputs[-1], "w"))
+                converter.convert_targets(xml_path, streams)
+            error = None
+    except (Exception, SystemExit) as e:
+        error = f'{type(e).__name__}: {e}'
+        for path in outputs:  # partly written
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        outputs = []
+    result = {
+        'xml': xml_path,
+        'outputs': outputs,
+        'ok': error is None,
+        'error': error,
+        'seconds': round(time.perf_counter() - start, 6)
+    }
+    if converter.keep_going:
+        result['diagnostics'] = converter.report()['counts']
+    return result
+
+
+def run_batch(args):
+    inputs = collect_inputs(args)
+    if not inputs:
+        console.log("no xml files found for batch conversion", style="bold red")
+        return 1
+
+    workers = args.workers or os.cpu_count() or 1
+    verbose = log_level(args) >= NORMAL
+    if verbose:
+        console.log(f"converting {len(inputs)} files with {workers} workers")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_file, xml_path, os.path.join(args.output_dir, name), args)
+                   for xml_path, name in inputs]
+        for future in as_completed(futures):
+            result = future.result()
+            if not result['ok']:
+                console.log("failed", result['xml'], result['error'], style="red")
+            results.append(result)
+    elapsed = time.perf_counter() - start
+
+    results.sort(key=lambda r: r['xml'])
+    failures = [r for r in results if not r['ok']]
+    summary = {
+        'files': len(results),
+        'succeeded': len(results) - len(failures),
+        'failed': len(failures),
+        'workers': workers,
+        'seconds': round(elapsed, 6),
+        'results': results
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'summary.json'), "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    if verbose:
+        print_summary(summary)
+    return 1 if failures else 0
+
+
+def print_summary(summary):
+    if not console.is_pretty():
+        for result in summary['results']:
+            console.print(f"{result['seconds']:10.3f}s {'ok' if result['ok'] else result['error']} {result['xml']}")
+        console.log(f"{summary['succeeded']} succeeded, {summary['failed']} failed "
+                    f"in {summary['seconds']:.2f}s with {summary['workers']} workers")
+        return
+
+    from rich.table import Table
+
+    table = Table(title="xml2dsl batch conversion")
+    table.add_column("xml")
+    table.add_column("status")
+    table.add_column("seconds", justify="right")
+    for result in summary['results']:
+        status = "ok" if result['ok'] else f"[red]{result['error']}[/red]"
+        table.add_row(result['xml'], status, f"{result['seconds']:.3f}")
+    console.print(table)
+    console.log(f"{summary['succeeded']} succeeded, {summary['failed']} failed "
+                f"in {summary['seconds']:.2f}s with {summary['workers']} workers")
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+from lxml import etree
+
+from xml2dsl.xml2dsl import write_atomic
+
+
+class TranslationCache:
+    """On-disk cache of translated camelContext blocks (routes, onException, dataFormats...).
+
+    Entries are keyed by a digest of the canonicalized subtree, the source lines relative to the block (the output
+    quotes them), the converter version and options and the document tables the translation reads (beans,
+    endpoints, groovy fields). The least recently used entries are evicted once the directory grows over max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes, fingerprint):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self.size = None
+
+    def key(self, node, context):
+        digest = hashlib.sha256()
+        digest.update(self.fingerprint.encode())
+        digest.update(context.encode())
+        if hasattr(node, 'canonical'):  # ir blocks
+            digest.update(node.canonical())
+        else:
+            digest.update(etree.tostring(node, method='c14n', with_tail=False))
+        base = node.sourceline
+        digest.update(','.join(str(element.sourceline - base) for element in node.iter()).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "r") as entry:
+                entry = json.load(entry)
+            os.utime(path)  # eviction is by modification time
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['text'], entry['indentation'], entry.get('diagnostics', [])
+
+    def put(self, key, text, indentation, diagnostics=()):
+        """Store a translation, a failed store only leaves the next lookup a miss."""
+        path = self.path(key)
+        try:
+            replaced = os.path.getsize(path)  # an overwritten entry no longer counts
+        except OSError:
+            replaced = 0
+        try:
+            write_atomic(path, json.dumps({'text': text, 'indentation': indentation,
+                                           'diagnostics': list(diagnostics)}))
+            if self.size is None:
+                self.size = sum(size for _, _, size in self.entries())
+            else:
+                self.size += os.path.getsize(path) - replaced
+            if self.size > self.max_bytes:
+                self.evict()
+        except OSError:
+            pass  # full disk, entry evicted by a concurrent conversion...
+
+    def entries(self):
+        for bucket in os.scandir(self.directory):
+            if bucket.is_dir():
+                for entry in os.scandir(bucket.path):
+                    if entry.name.endswith('.json'):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue  # evicted by a concurrent conversion
+                        yield entry.path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is back to 90% of max_bytes."""
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        self.size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # removed by a concurrent conversion
+            self.size -= size
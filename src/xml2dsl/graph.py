@@ -0,0 +1,248 @@
+"""--graph / --prune: the call graph of the routes through their direct:, seda: and vm: endpoints.
+
+Every camelContext block is a node. Routes consume the internal endpoints of their ``from`` and every block (routes,
+onException, rest...) calls the endpoints of its ``to``, ``toD``, ``wireTap``, ``enrich``, ``recipientList``...
+Blocks which are not routes and routes fed by other components (timers, queues, http...) are the entry points, the
+routes they cannot reach are dead code as far as the document goes. ``direct-vm:`` and ``vm:`` are there to be called
+from the other contexts of the JVM, the routes consuming them are entry points as well. Uris with placeholders
+(``direct:${header.to}``) call every route whose endpoint matches them, uris whose component is not known at all may
+call any route.
+
+The graph is built from the start and end events of the document index pass, so it costs no extra parse with
+--stream.
+"""
+import collections
+import re
+
+from lxml import etree
+
+from xml2dsl.xml2dsl import DocumentIndex, local_name, qualified_tag
+
+INTERNAL_COMPONENTS = frozenset(('direct', 'direct-vm', 'seda', 'vm'))
+# internal components shared by the contexts of a JVM, consumed and called outside the document too
+JVM_COMPONENTS = frozenset(('direct-vm', 'vm'))
+FROM = qualified_tag('from')
+# elements sending to their uri (or ref) attribute
+URI_CALLS = frozenset(qualified_tag(name) for name in ('to', 'toD', 'wireTap', 'inOnly', 'inOut', 'enrich',
+                                                         'pollEnrich'))
+# elements sending to the uris of their expression -> attribute with the uri delimiter and its default
+EXPRESSION_CALLS = {
+    qualified_tag('recipientList'): ('delimiter', ','),
+    qualified_tag('routingSlip'): ('uriDelimiter', ','),
+    qualified_tag('dynamicRouter'): (None, None),
+    qualified_tag('enrich'): (None, None),
+    qualified_tag('pollEnrich'): (None, None)
+}
+LITERAL_LANGUAGES = frozenset(('constant', 'simple'))
+PLACEHOLDER = re.compile(r'\$\{[^}]*\}|\{\{[^}]*\}\}')
+
+# routes listed as fan-out / fan-in hot spots
+HOT_SPOTS = 10
+
+
+class Block:
+    __slots__ = ('route', 'position', 'id', 'line', 'consumes', 'calls', 'targets')
+
+    def __init__(self, node, position):
+        self.route = node.tag == DocumentIndex.ROUTE
+        self.position = position  # among the routes, -1 for the other blocks
+        self.id = node.get('id') if self.route else local_name(node.tag)
+        self.line = node.sourceline
+        self.consumes = []  # uris of the from elements
+        self.calls = []  # (uri, source line), None as uri when the expression is not a literal
+        self.targets = None
+
+    def name(self):
+        if self.id is None:
+            return self.consumes[0] if self.consumes else 'route'
+        return self.id
+
+    def describe(self, **counts):
+        return dict(route=self.name(), line=self.line, **counts)
+
+
+def endpoint_key(uri, endpoints):
+    """``component:name`` of an internal endpoint uri, '' for the other components, None when the component is not
+    known (placeholders, expressions)."""
+    if uri is None:
+        return None
+    if uri.startswith('ref:'):
+        uri = endpoints.get(uri[4:])
+        if uri is None:
+            return ''  # unresolved reference, reported by the converter
+    component, separator, remaining = uri.partition(':')
+    if not separator or PLACEHOLDER.search(component):
+        return None if PLACEHOLDER.search(uri) else ''
+    if component not in INTERNAL_COMPONENTS:
+        return ''
+    return f'{component}:{remaining.lstrip("/").partition("?")[0]}'
+
+
+def strongly_connected(nodes, successors):
+    """Tarjan's algorithm with an explicit stack, returns the components that are cycles (more than one node, or a
+    node calling itself)."""
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    cycles = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors(root)))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in successors(node):
+                        cycles.append(component[::-1])
+    return cycles
+
+
+class RouteGraph:
+
+    def __init__(self):
+        self.blocks = []
+        self.routes = []
+        self.depth = 0
+        self.block = None
+
+    @classmethod
+    def from_tree(cls, root):
+        graph = cls()
+        for event, node in etree.iterwalk(root, events=('start', 'end')):
+            graph.feed(event, node)
+        return graph
+
+    def observe(self, events):
+        """Pass (start, end) iterparse events through, adding their blocks to the graph on the way."""
+        for event, node in events:
+            self.feed(event, node)
+            yield event, node
+
+    def feed(self, event, node):
+        block = self.block
+        if event == 'start':
+            self.depth += 1
+            if self.depth == 3:
+                if node.getparent().tag == DocumentIndex.CONTEXT:
+                    self.block = Block(node, len(self.routes) if node.tag == DocumentIndex.ROUTE else -1)
+                    self.blocks.append(self.block)
+                    if self.block.route:
+                        self.routes.append(self.block)
+            elif block is not None:
+                tag = node.tag
+                if tag == FROM:
+                    if block.route and self.depth == 4:
+                        block.consumes.append(node.get('uri'))
+                elif tag in URI_CALLS and ('uri' in node.attrib or 'ref' in node.attrib):
+                    uri = node.get('uri')
+                    block.calls.append((uri if uri is not None else 'ref:' + node.get('ref'), node.sourceline))
+            return
+
+        if self.depth == 3:
+            self.block = None
+        elif block is not None and self.depth > 4:
+            parent = node.getparent()
+            if parent.tag in EXPRESSION_CALLS and 'uri' not in parent.attrib:
+                self.add_expression_calls(block, node, parent)
+        self.depth -= 1
+
+    @staticmethod
+    def add_expression_calls(block, node, parent):
+        text = (node.text or '').strip()
+        if local_name(node.tag) not in LITERAL_LANGUAGES or not text:
+            block.calls.append((None, node.sourceline))
+            return
+        attribute, default = EXPRESSION_CALLS[parent.tag]
+        delimiter = parent.get(attribute, default) if attribute else None
+        for uri in text.split(delimiter) if delimiter else [text]:
+            block.calls.append((uri.strip(), node.sourceline))
+
+    def analyze(self, endpoints):
+        """Report of the graph, endpoints (id -> uri) resolves the ref: uris. Sets the unreachable routes."""
+        consumers = collections.defaultdict(list)  # endpoint key -> routes
+        entry_points = [block for block in self.blocks if not block.route]
+        for route in self.routes:
+            keys = [endpoint_key(uri, endpoints) for uri in route.consumes]
+            if not keys or any(not key or PLACEHOLDER.search(key) or key.partition(':')[0] in JVM_COMPONENTS
+                               for key in keys):
+                entry_points.append(route)  # fed from outside the document
+            for key in keys:
+                if key:
+                    consumers[key].append(route)
+
+        # static targets feed the cycles and hot spots, matched patterns only the reachability
+        dangling = []
+        dynamic = []
+        matched = {}
+        for block in self.blocks:
+            block.targets = {}
+            for uri, line in block.calls:
+                key = endpoint_key(uri, endpoints)
+                if key is None:
+                    dynamic.append({'route': block.name(), 'uri': uri, 'line': line, 'matches': len(self.routes)})
+                    matched.setdefault(block.position, []).extend(self.routes)
+                elif PLACEHOLDER.search(key):
+                    pattern = re.compile('.*'.join(map(re.escape, PLACEHOLDER.split(key))) + r'\Z')
+                    routes = [route for consumer, routes in consumers.items() if pattern.match(consumer)
+                              for route in routes]
+                    dynamic.append({'route': block.name(), 'uri': uri, 'line': line, 'matches': len(routes)})
+                    matched.setdefault(block.position, []).extend(routes)
+                elif key:
+                    if key not in consumers and key.partition(':')[0] not in JVM_COMPONENTS:
+                        dangling.append({'route': block.name(), 'endpoint': key, 'line': line})
+                    for route in consumers.get(key, ()):
+                        block.targets.setdefault(route.position, line)
+
+        reached = set()
+        stack = list(entry_points)
+        while stack:
+            block = stack.pop()
+            if block.route:
+                if block.position in reached:
+                    continue
+                reached.add(block.position)
+            stack.extend(self.routes[position] for position in block.targets)
+            stack.extend(matched.get(block.position, ()))
+        self.unreachable = [route.position for route in self.routes if route.position not in reached]
+
+        callers = collections.Counter(position for block in self.blocks for position in block.targets)
+        fan_out = sorted((route for route in self.routes if len(route.targets) > 1),
+                         key=lambda route: len(route.targets), reverse=True)
+        fan_in = sorted((route for route in self.routes if callers[route.position] > 1),
+                        key=lambda route: callers[route.position], reverse=True)
+        cycles = strongly_connected(range(len(self.routes)), lambda position: self.routes[position].targets)
+        return {
+            'routes': len(self.routes),
+            'entry_points': [route.describe() for route in entry_points if route.route],
+            'unreachable': [self.routes[position].describe() for position in self.unreachable],
+            'cycles': [[self.routes[position].describe() for position in cycle] for cycle in cycles],
+            'fan_out': [route.describe(calls=len(route.targets)) for route in fan_out[:HOT_SPOTS]],
+            'fan_in': [route.describe(callers=callers[route.position]) for route in fan_in[:HOT_SPOTS]],
+            'dangling': dangling,
+            'dynamic': dynamic
+        }
@@ -0,0 +1,118 @@
+"""Spring ``<import resource="..."/>`` resolution, the beans of imported documents are added to the document index.
+
+Resources are resolved like spring does: relative to the importing file, ``file:`` paths as they are and
+``classpath:`` / ``classpath*:`` against the --classpath roots. Every imported document is parsed once per process
+into a small table (its beans and its own imports) shared by all the conversions of a run, dozens of contexts
+usually import the same common beans. The tables are reloaded when the file changes, for long running servers.
+"""
+import os
+import posixpath
+import threading
+
+from lxml import etree
+
+from xml2dsl.xml2dsl import ARCHIVE_SEPARATOR, PARSER_OPTIONS, DocumentIndex, parse_document
+
+
+class ImportedDocument:
+    __slots__ = ('path', 'beans', 'imports')
+
+    def __init__(self, path, beans, imports):
+        self.path = path
+        self.beans = beans  # id -> class
+        self.imports = imports  # [(resource, source line)]
+
+
+_documents = {}  # path -> (file stamp, ImportedDocument)
+_documents_lock = threading.Lock()
+
+
+def file_stamp(path):
+    stat = os.stat(path.partition(ARCHIVE_SEPARATOR)[0])
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load(path):
+    """The ImportedDocument of path, parsed on first use."""
+    stamp = file_stamp(path)
+    with _documents_lock:
+        cached = _documents.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    index = DocumentIndex.from_tree(parse_document(path, etree.XMLParser(**PARSER_OPTIONS)))
+    document = ImportedDocument(path, index.beans, index.imports)
+    with _documents_lock:
+        _documents[path] = stamp, document
+    return document
+
+
+def clear():
+    with _documents_lock:
+        _documents.clear()
+
+
+def exists(path):
+    archive, separator, entry = path.partition(ARCHIVE_SEPARATOR)
+    if not separator:
+        return os.path.isfile(path)
+    import zipfile
+    try:
+        with zipfile.ZipFile(archive) as zip_file:
+            zip_file.getinfo(entry)
+        return True
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+
+
+def normalize(path):
+    """Absolute path, also identifying archive entries (app.war!/WEB-INF/classes/beans.xml)."""
+    archive, separator, entry = path.partition(ARCHIVE_SEPARATOR)
+    if not separator:
+        return os.path.abspath(path)
+    return os.path.abspath(archive) + separator + posixpath.normpath(entry)
+
+
+def join(directory, resource):
+    if ARCHIVE_SEPARATOR in directory:
+        return normalize(posixpath.join(directory, resource))
+    return normalize(os.path.join(directory, resource))
+
+
+def resolve(resource, importing, classpath):
+    """Existing paths of an import resource, importing is the path of the importing document (None when the
+    converted document is not a file: relative resources are then resolved from the working directory)."""
+    if '${' in resource:
+        return []  # property placeholders are resolved by the application
+    if resource.startswith(('classpath:', 'classpath*:')):
+        name = resource.partition(':')[2].lstrip('/')
+        paths = [join(root, name) for root in classpath]
+        paths = [path for path in paths if exists(path)]
+        return paths if resource.startswith('classpath*:') else paths[:1]
+    if resource.startswith('file:'):
+        path = normalize(resource[5:])
+    else:
+        directory = os.path.dirname(importing) if importing is not None else os.getcwd()
+        path = join(directory, resource)
+    return [path] if exists(path) else []
+
+
+def imported_beans(importing, imports, classpath, error):
+    """Beans of the documents imported by imports, transitively. error(kind, importing path, line, detail) is
+    called for unresolved resources ('missing-ref') and import cycles ('import-cycle'), which are skipped."""
+
+    def visit(importing, imports, chain):
+        beans = {}
+        for resource, line in imports:
+            paths = resolve(resource, importing, classpath)
+            if not paths:
+                error('missing-ref', importing, line, resource)
+            for path in paths:
+                if path in chain:
+                    error('import-cycle', importing, line, ' -> '.join(chain[chain.index(path):] + [path]))
+                    continue
+                document = load(path)
+                beans.update(visit(path, document.imports, chain + [path]))
+                beans.update(document.beans)  # spring: the later definition of an id wins
+        return beans
+
+    return visit(importing, imports, [importing] if importing is not None else [])
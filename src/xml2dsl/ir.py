@@ -0,0 +1,99 @@
+"""Compact form of the camelContext blocks, shared by every output target of a run.
+
+Blocks are copied out of the lxml tree once (the lxml subtree can be released right away with --stream) and then fed
+to the java converter and the other emitters. Elements implement the subset of the lxml element api the handlers
+use: ``tag``, ``attrib``, ``text``, ``sourceline``, ``len()``, indexing, iteration, ``get()``, ``keys()``,
+``getparent()`` and ``iter()``.
+"""
+import json
+import sys
+import types
+
+from lxml import etree
+
+# attributes of the (many) elements without any, read only as it is shared
+NO_ATTRIBUTES = types.MappingProxyType({})
+NO_CHILDREN = ()
+
+
+class Element:
+    __slots__ = ('tag', 'attrib', 'text', 'sourceline', 'children', 'parent')
+
+    def __init__(self, tag, attrib=NO_ATTRIBUTES, text=None, sourceline=None, parent=None):
+        self.tag = tag
+        self.attrib = attrib
+        self.text = text
+        self.sourceline = sourceline
+        self.children = NO_CHILDREN
+        self.parent = parent
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __len__(self):
+        return len(self.children)
+
+    def __getitem__(self, index):
+        return self.children[index]
+
+    def __getstate__(self):
+        # blocks are pickled to the --jobs workers, the shared empty attributes are not picklable
+        return self.tag, self.attrib or None, self.text, self.sourceline, self.children, self.parent
+
+    def __setstate__(self, state):
+        self.tag, attrib, self.text, self.sourceline, self.children, self.parent = state
+        self.attrib = attrib if attrib is not None else NO_ATTRIBUTES
+
+    def __repr__(self):
+        return f'<ir.Element {self.tag} at line {self.sourceline}>'
+
+    def append(self, child):
+        if self.children is NO_CHILDREN:
+            self.children = []
+        self.children.append(child)
+        child.parent = self
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def keys(self):
+        return list(self.attrib)
+
+    def getparent(self):
+        return self.parent
+
+    def iter(self, *tags):
+        """Preorder walk of the subtree, optionally only the elements with one of tags."""
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            if not tags or element.tag in tags:
+                yield element
+            stack.extend(reversed(element.children))
+
+    def canonical(self):
+        """Serialization identifying the subtree content, the translation cache key of ir blocks."""
+        return '\n'.join(json.dumps([element.tag, sorted(element.attrib.items()), element.text, len(element)])
+                         for element in self.iter()).encode()
+
+
+def from_lxml(root):
+    """Copy an lxml subtree. Comments and processing instructions are dropped, as well as whitespace only text of
+    elements with children; tags and attribute names are interned."""
+    intern = sys.intern
+    copy = None
+    stack = []
+    for event, node in etree.iterwalk(root, events=('start', 'end'), tag=etree.Element):
+        if event == 'end':
+            copy = stack.pop()
+            continue
+        text = node.text
+        if text is not None and text.isspace() and len(node):
+            text = None
+        items = node.items()
+        attrib = {intern(name): intern(value) for name, value in items} if items else NO_ATTRIBUTES
+        element = Element(intern(node.tag), attrib, text, node.sourceline)
+        if stack:
+            stack[-1].append(element)
+        stack.append(element)
+    return copy
@@ -0,0 +1,147 @@
+"""--jobs: the camelContext blocks of one document translated in a process pool.
+
+Blocks travel to the workers serialized, with the source line of every element so that the generated comments and
+errors point to the original document. Workers receive the options and the document index once, at startup.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import collections
+
+from lxml import etree
+
+from xml2dsl import ir
+from xml2dsl.xml2dsl import PARSER_OPTIONS, ConversionError, Converter
+
+# blocks sent to a worker at once, a task per route costs more in pickling than the translation itself
+BATCH_BLOCKS = 32
+BATCH_BYTES = 1 << 20
+
+# batches in flight per job, bounds the memory held by pending translations with --stream
+WINDOW_PER_JOB = 2
+
+# lxml only accepts source lines up to 65535, longer blocks are translated in the main process
+MAX_BLOCK_LINES = 65535
+
+_converter = None
+
+
+def init_worker(options, index):
+    global _converter
+    _converter = Converter(options)
+    _converter.index = index
+
+
+def serialize(node):
+    if isinstance(node, ir.Element):
+        return node, None  # pickled as is
+    return etree.tostring(node, with_tail=False), [element.sourceline for element in node.iter()]
+
+
+def translate_serialized(converter, xml, sourcelines, indentation):
+    """Translate a serialized block, its source lines are restored relative to the block (the translation only
+    quotes relative lines) and errors are reported with the original line."""
+    if sourcelines is None:
+        return converter.translate_detached(xml, indentation)
+    node = etree.fromstring(xml, etree.XMLParser(**PARSER_OPTIONS))
+    offset = sourcelines[0] - 1
+    for element, sourceline in zip(node.iter(), sourcelines):
+        element.sourceline = sourceline - offset
+    try:
+        return converter.translate_detached(node, indentation)
+    except ConversionError as e:
+        e.sourceline += offset
+        raise type(e)(e, e.detail) from None
+
+
+def translate_batch(blocks, indentation):
+    """Worker entry point, translations of consecutive blocks with the indentation each one started from and the
+    memo hits and misses of each."""
+    results = []
+    for xml, sourcelines in blocks:
+        hits, misses = _converter.memo_hits, _converter.memo_misses
+        text, change, diagnostics = translate_serialized(_converter, xml, sourcelines, indentation)
+        results.append((text, change, diagnostics, indentation,
+                        _converter.memo_hits - hits, _converter.memo_misses - misses))
+        indentation += change
+    return results
+
+
+class ParallelTranslator:
+    """Submits blocks to the pool and writes their translations to the converter in document order.
+
+    Cached blocks are resolved in the main process, the misses are sent to the workers in batches.
+    """
+
+    def __init__(self, converter, jobs):
+        self.converter = converter
+        self.window = jobs * WINDOW_PER_JOB * BATCH_BLOCKS
+        # [source line, cache key, translation or (future, position), block, tag]
+        self.pending = collections.deque()
+        self.batch = []
+        self.batch_bytes = 0
+        self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                            initargs=(converter.options, converter.index))
+
+    def submit(self, node):
+        converter = self.converter
+        key = entry = block = None
+        if converter.cache is not None and node.tag in converter.CACHED_BLOCKS:
+            key = converter.cache_key(node)
+            entry = converter.cache.get(key)
+
+        if entry is None:
+            block = serialize(node)
+            if block[1] is not None and block[1][-1] - block[1][0] >= MAX_BLOCK_LINES:
+                entry = converter.translate_detached(node, converter.indentation)
+                block = None
+                if key is not None:
+                    converter.cache.put(key, *entry)
+
+        item = [node.sourceline, key, entry, block, node.tag]
+        self.pending.append(item)
+        if block is not None:
+            self.batch.append(item)
+            self.batch_bytes += len(block[0]) if block[1] is not None else BATCH_BYTES // BATCH_BLOCKS
+            if len(self.batch) >= BATCH_BLOCKS or self.batch_bytes >= BATCH_BYTES:
+                self.dispatch()
+        while len(self.pending) > self.window:
+            self.write_next()
+
+    def dispatch(self):
+        if not self.batch:
+            return
+        future = self.executor.submit(translate_batch, [item[3] for item in self.batch], self.converter.indentation)
+        for position, item in enumerate(self.batch):
+            item[2] = future, position
+        self.batch = []
+        self.batch_bytes = 0
+
+    def write_next(self):
+        converter = self.converter
+        item = self.pending.popleft()
+        base, key, entry, block, tag = item
+        if block is not None:
+            if entry is None:
+                self.dispatch()
+                entry = item[2]
+            future, position = entry
+            text, change, diagnostics, indentation, hits, misses = future.result()[position]
+            entry = text, change, diagnostics
+            converter.memo_hits += hits
+            converter.memo_misses += misses
+            if indentation != converter.indentation:
+                # an earlier block changed the indentation this one was translated with
+                entry = translate_serialized(converter, *block, converter.indentation)
+                key = None
+            if key is not None:
+                converter.cache.put(key, *entry)
+        with converter.block_output(tag):
+            converter.write_translation(entry, base)
+        converter.out.flush()
+
+    def finish(self):
+        self.dispatch()
+        while self.pending:
+            self.write_next()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,168 @@
+"""--profile: per-handler instrumentation of a conversion.
+
+The profiler replaces the converter ``analyze_element`` dispatch by a timed one, only when profiling, and keeps for
+every ``*_def`` handler the number of calls, the cumulative time, the self time (without the nested handlers) and the
+output characters it produced itself. Self times are also kept per handler stack for flamegraph tools.
+
+Fragments written from the memo and blocks written from the translation cache skip the handlers: they are counted
+as the ``memo_hit`` / ``cache_hit`` pseudo handlers, in phases of their own.
+"""
+import collections
+import contextlib
+import time
+import types
+
+from xml2dsl.xml2dsl import DslWriter
+
+
+class HandlerStats:
+    __slots__ = ('calls', 'cumulative', 'self', 'output_chars')
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self = 0.0
+        self.output_chars = 0
+
+    def as_dict(self):
+        return {'calls': self.calls, 'cumulative': round(self.cumulative, 6), 'self': round(self.self, 6),
+                'output_chars': self.output_chars}
+
+
+class Profiler:
+
+    def __init__(self):
+        self.handlers = collections.defaultdict(HandlerStats)  # handler name -> HandlerStats
+        self.stacks = collections.Counter()  # 'route_def;from_def;log_def' -> self seconds
+        self.total = 0.0
+        self.translate = 0.0  # time in the outermost handlers
+        self.write = 0.0  # time writing the output, in the converter thread
+        self.memo = 0.0  # fragments written from the memo, see Converter.translate_memoized
+        self.cache = 0.0  # blocks written from the translation cache
+        self.background_write = 0.0  # --output-dir class files, written while the next context is translated
+
+    def instrument(self, converter):
+        """Time every element dispatched by converter."""
+        analyze_element = type(converter).analyze_element.__get__(converter)
+        handlers = converter.handlers
+        perf_counter = time.perf_counter
+
+        # names and [nested handlers time, nested handlers output, first chunk, start] of the running handlers,
+        # container handlers (generators) run from their first to their last resumption
+        names = []
+        frames = []
+
+        def open_frame(name):
+            names.append(name)
+            frames.append([0.0, 0, len(converter.out.chunks), perf_counter()])
+
+        def close_frame(result):
+            nested_time, nested_chars, start_chunk, start = frames.pop()
+            elapsed = perf_counter() - start
+            chars = sum(map(len, converter.out.chunks[start_chunk:]))
+            if isinstance(result, str):
+                chars += len(result)
+            name = ';'.join(names)
+            stats = self.handlers[names.pop()]
+            stats.calls += 1
+            stats.cumulative += elapsed
+            stats.self += elapsed - nested_time
+            stats.output_chars += chars - nested_chars
+            self.stacks[name] += elapsed - nested_time
+            if frames:
+                frames[-1][0] += elapsed
+                frames[-1][1] += chars
+            else:
+                self.translate += elapsed
+
+        def profiled_block(block):
+            yield from block
+            close_frame(None)
+
+        def profiled_analyze_element(node):
+            handler = handlers.get(node.tag)
+            open_frame(handler.__name__ if handler is not None else converter.entry_point_handler(node).__name__)
+            try:
+                result = analyze_element(node)
+            except BaseException:
+                close_frame(None)
+                raise
+            if type(result) is types.GeneratorType:
+                return profiled_block(result)
+            close_frame(result)
+            return result
+
+        def profiled_reuse(name, phase, write):
+            # write returns False when there is nothing to reuse, its time then stays with the caller
+            def reuse(*args):
+                start_chunk = len(converter.out.chunks)
+                start = perf_counter()
+                if write(*args) is False:
+                    return False
+                elapsed = perf_counter() - start
+                chars = sum(map(len, converter.out.chunks[start_chunk:]))
+                stats = self.handlers[name]
+                stats.calls += 1
+                stats.cumulative += elapsed
+                stats.self += elapsed
+                stats.output_chars += chars
+                self.stacks[';'.join(names + [name])] += elapsed
+                setattr(self, phase, getattr(self, phase) + elapsed)
+                if frames:
+                    frames[-1][0] += elapsed
+                    frames[-1][1] += chars
+                    self.translate -= elapsed  # part of the outermost handler time
+                return True
+            return reuse
+
+        converter.analyze_element = profiled_analyze_element
+        converter.write_fragment = profiled_reuse('memo_hit', 'memo', type(converter).write_fragment.__get__(converter))
+        converter.translate_cached = profiled_reuse('cache_hit', 'cache',
+                                                    type(converter).translate_cached.__get__(converter))
+
+    def writer(self, stream):
+        return ProfiledWriter(stream, self)
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, phase, getattr(self, phase) + time.perf_counter() - start)
+
+    def phases(self):
+        """parse covers everything outside the handlers, the reused translations and the output writes: reading,
+        indexing, walking."""
+        return {
+            'total': round(self.total, 6),
+            'parse': round(max(self.total - self.translate - self.memo - self.cache - self.write, 0.0), 6),
+            'translate': round(self.translate, 6),
+            'memo': round(self.memo, 6),
+            'cache': round(self.cache, 6),
+            'write': round(self.write + self.background_write, 6)
+        }
+
+    def report(self):
+        handlers = sorted(self.handlers.items(), key=lambda item: item[1].self, reverse=True)
+        return {
+            'phases': self.phases(),
+            'handlers': [dict(handler=name, **stats.as_dict()) for name, stats in handlers]
+        }
+
+    def collapsed(self):
+        """Collapsed stacks (``frame;frame;frame value``) of the handlers self time in microseconds."""
+        return ''.join(f'{stack} {round(seconds * 1e6)}\n' for stack, seconds in sorted(self.stacks.items())
+                       if round(seconds * 1e6))
+
+
+class ProfiledWriter(DslWriter):
+    """DslWriter timing its writes to the stream."""
+
+    def __init__(self, stream, profiler):
+        super().__init__(stream)
+        self.profiler = profiler
+
+    def flush(self):
+        with self.profiler.timed('write'):
+            super().flush()
@@ -0,0 +1,127 @@
+"""Long running conversion server, answers json-lines requests on stdin/stdout or on a unix socket.
+
+Request:  {"id": 1, "path": "context.xml", "options": {"stream": true}}
+          {"id": 2, "xml": "<beans>...</beans>"}
+Response: {"id": 1, "ok": true, "java": "...", "diagnostics": [], "seconds": 0.01}
+          {"id": 2, "ok": false, "error": "...", "diagnostics": [{"level": "error", ...}], "seconds": 0.01}
+"""
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+from xml2dsl.xml2dsl import NORMAL, ConversionError, Converter, console, log_level
+
+# options a request may override, everything else comes from the server command line
+REQUEST_OPTIONS = Converter.OUTPUT_OPTIONS + ('keep_going', 'stream', 'cache_dir', 'no_cache', 'cache_max_mb')
+
+
+def request_options(base, overrides):
+    options = copy.copy(base)
+    for name, value in (overrides or {}).items():
+        if name not in REQUEST_OPTIONS:
+            raise ValueError(f'unsupported option {name}, expected one of {", ".join(REQUEST_OPTIONS)}')
+        setattr(options, name, value)
+    options.quiet = True
+    options.verbose = False
+    return options
+
+
+def handle_request(request, base_options):
+    """Convert one request with its own Converter, never raises."""
+    start = time.perf_counter()
+    response = {'id': request.get('id') if isinstance(request, dict) else None}
+    diagnostics = []
+    try:
+        if not isinstance(request, dict) or ('path' in request) == ('xml' in request):
+            raise ValueError('a request is a json object with either "path" or "xml"')
+        converter = Converter(request_options(base_options, request.get('options')))
+        if 'xml' in request:
+            source = request['xml'].encode()
+        else:
+            source = request['path']
+        java = converter.convert(source)
+        diagnostics.extend(converter.diagnostics)
+        response.update(ok=True, java=java)
+    except ConversionError as e:
+        diagnostics.append({'level': 'error', 'message': str(e), 'tag': e.tag, 'line': e.sourceline})
+        response.update(ok=False, error=str(e))
+    except Exception as e:
+        diagnostics.append({'level': 'error', 'message': f'{type(e).__name__}: {e}'})
+        response.update(ok=False, error=f'{type(e).__name__}: {e}')
+    response['diagnostics'] = diagnostics
+    response['seconds'] = round(time.perf_counter() - start, 6)
+    return response
+
+
+def handle_stream(reader, writer, executor, base_options):
+    """Read requests from reader until EOF, responses are written in completion order."""
+    lock = threading.Lock()
+    pending = []
+
+    def respond(response):
+        with lock:
+            writer.write(json.dumps(response) + '\n')
+            writer.flush()
+
+    def run(request):
+        respond(handle_request(request, base_options))
+
+    for line in reader:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            respond({'id': None, 'ok': False, 'error': f'invalid json: {e}', 'diagnostics': []})
+            continue
+        pending.append(executor.submit(run, request))
+
+    for future in pending:
+        future.result()
+
+
+class SocketHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        reader = io.TextIOWrapper(self.rfile, encoding='utf-8')
+        writer = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+        handle_stream(reader, writer, self.server.executor, self.server.base_options)
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(args):
+    # warm everything up once, requests only pay for the conversion
+    Converter.dispatch_table()
+    workers = args.workers or os.cpu_count() or 1
+    verbose = log_level(args) >= NORMAL
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if not args.socket:
+            if verbose:
+                console.log(f"xml2dsl server ready on stdin with {workers} workers")
+            handle_stream(sys.stdin, sys.stdout, executor, args)
+            return 0
+
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        with ConversionServer(args.socket, SocketHandler) as server:
+            server.executor = executor
+            server.base_options = args
+            if verbose:
+                console.log(f"xml2dsl server listening on {args.socket} with {workers} workers")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(args.socket)
+    return 0
@@ -0,0 +1,76 @@
+"""--shard-routes / --shard-size: the routes of a camelContext spread over several RouteBuilder classes.
+
+A RouteBuilder with thousands of routes has a configure() method over the 64KB JVM method limit, slow to compile and
+never JIT compiled. Shards are cut at route boundaries while the blocks are written in document order: the route
+making a shard exceed its route count or size budget starts the next one. onException, data formats, profiles and
+the other context configuration are route builder scoped in the java dsl, they are repeated at the top of every
+following shard. Every shard only autowires the beans and declares the groovy fields its own code uses.
+"""
+import contextlib
+import re
+
+from xml2dsl.xml2dsl import Converter, DslWriter, qualified_tag
+
+# blocks spread over the shards
+ROUTE_BLOCKS = frozenset(qualified_tag(name) for name in ('route', 'rest'))
+# context wide configuration, written once in the shard it appears in
+SINGLE_BLOCKS = frozenset(qualified_tag(name) for name in ('restConfiguration', 'threadPool', 'threadPoolProfile'))
+
+IDENTIFIER = re.compile(r'[A-Za-z_$][\w$]*')
+
+
+class Shards:
+    """Bodies of the RouteBuilder classes of one camelContext, the body of the current shard is converter.out."""
+
+    def __init__(self, converter, max_routes=None, max_chars=None):
+        self.converter = converter
+        self.max_routes = max_routes or float('inf')
+        self.max_chars = max_chars or float('inf')
+        self.bodies = []  # bodies of the complete shards
+        self.shared = []  # text of the repeated configuration blocks
+        self.routes = 0  # routes of the current shard
+        self.chars = 0  # size of the current shard body
+
+    @contextlib.contextmanager
+    def block(self, tag):
+        """Around the write of a camelContext block to converter.out."""
+        chunks = self.converter.out.chunks
+        start = len(chunks)
+        yield
+        text = chunks[start:]
+        size = sum(map(len, text))
+        if tag in ROUTE_BLOCKS:
+            if self.routes and (self.routes >= self.max_routes or self.chars + size > self.max_chars):
+                del chunks[start:]
+                self.next_shard()
+                self.converter.out.chunks.extend(text)
+            self.routes += 1
+        elif tag not in SINGLE_BLOCKS:
+            self.shared.append(''.join(text))
+        self.chars += size
+
+    def next_shard(self):
+        self.bodies.append(self.converter.out.getvalue())
+        self.converter.out = out = DslWriter()
+        for text in self.shared:
+            out.write(text)
+        self.routes = 0
+        self.chars = sum(map(len, self.shared))
+
+    def classes(self, class_name, scripts):
+        """(class name, java source) of every shard, a context fitting in one shard keeps its unsharded class."""
+        converter = self.converter
+        bodies = self.bodies + [converter.out.getvalue()]
+        if len(bodies) == 1:
+            head = converter.class_head(class_name, scripts, converter.index.beans)
+            return [(class_name, head + bodies[0] + Converter.CLASS_TAIL)]
+
+        groovy = converter.index.groovy
+        classes = []
+        for number, body in enumerate(bodies, 1):
+            identifiers = set(IDENTIFIER.findall(body))
+            beans = {name: bean_type for name, bean_type in converter.index.beans.items() if name in identifiers}
+            shard_scripts = [text for text in scripts if f'groovy_{groovy[text]}' in identifiers]
+            name = f'{class_name}Part{number}'
+            classes.append((name, converter.class_head(name, shard_scripts, beans) + body + Converter.CLASS_TAIL))
+        return classes
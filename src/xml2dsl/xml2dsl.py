@@ -1,18 +1,674 @@
-import configargparse
-from lxml import etree, objectify
-from rich import console
-from rich.console import Console
-import importlib.metadata
+import argparse
+import contextlib
+import functools
+import hashlib
+import io
+from lxml import etree
+import json
+import os
 import re
 import sys
+import time
+import types
 
-__version__ = importlib.metadata.version('camel-xml2dsl')
 ns = {
     "camel": "http://camel.apache.org/schema/spring",
     "beans": "http://www.springframework.org/schema/beans"
 }
 
-console = Console()
+
+
+@functools.lru_cache(maxsize=None)
+def version():
+    import importlib.metadata
+    return importlib.metadata.version('camel-xml2dsl')
+
+
+def __getattr__(name):
+    # the distribution metadata lookup is slow, __version__ is only resolved when asked for
+    if name == '__version__':
+        return version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazyConsole:
+    """stderr logger, rich is only imported when the output is pretty (stderr is a terminal and --plain is off)."""
+
+    def __init__(self):
+        self.pretty = None
+        self.rich_console = None
+
+    def is_pretty(self):
+        if self.pretty is None:
+            self.pretty = sys.stderr.isatty()
+        return self.pretty
+
+    def rich(self):
+        if self.rich_console is None:
+            from rich.console import Console
+            self.rich_console = Console(stderr=True)
+        return self.rich_console
+
+    def log(self, *objects, style=None):
+        if self.is_pretty():
+            self.rich().log(*objects, style=style, _stack_offset=2)
+        else:
+            print(time.strftime('[%X]'), *objects, file=sys.stderr, flush=True)
+
+    def print(self, *objects):
+        if self.is_pretty():
+            self.rich().print(*objects)
+        else:
+            print(*objects, file=sys.stderr, flush=True)
+
+
+console = LazyConsole()
+
+HANDLERS_ENTRY_POINT = 'xml2dsl.handlers'
+
+QUIET, NORMAL, VERBOSE = 0, 1, 2
+
+# custom handlers, qualified tag -> function(converter, node)
+_registered_handlers = {}
+_registry_generation = 0
+
+
+def qualified_tag(name, namespace=ns['camel']):
+    return f'{{{namespace}}}{name}' if namespace else name
+
+
+def register_handler(name, namespace=ns['camel']):
+    """Decorator registering ``func(converter, node)`` as the translator of the ``<name>`` element.
+
+    Handlers follow the same contract as the ``*_def`` methods: return the generated text, or write it to
+    ``converter.out`` and ``yield`` the children to translate, the code after the yield closing the element.
+    """
+    def decorator(func):
+        global _registry_generation
+        _registered_handlers[qualified_tag(name, namespace)] = func
+        _registry_generation += 1
+        return func
+    return decorator
+
+
+def unregister_handler(name, namespace=ns['camel']):
+    global _registry_generation
+    _registered_handlers.pop(qualified_tag(name, namespace), None)
+    _registry_generation += 1
+
+
+@functools.lru_cache(maxsize=None)
+def load_entry_point_handlers():
+    """Handlers published by other distributions under the ``xml2dsl.handlers`` entry point group.
+
+    The entry point name is the element name (camel namespace) or a qualified ``{namespace}name`` tag. Scanning the
+    installed distributions is slow, so this only happens the first time an element without handler is found.
+    """
+    import importlib.metadata
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=HANDLERS_ENTRY_POINT)
+    else:
+        entry_points = entry_points.get(HANDLERS_ENTRY_POINT, [])
+    return {entry_point.name if entry_point.name.startswith('{') else qualified_tag(entry_point.name):
+            entry_point.load() for entry_point in entry_points}
+
+
+def log_level(options):
+    if getattr(options, 'quiet', False):
+        return QUIET
+    return VERBOSE if getattr(options, 'verbose', False) else NORMAL
+
+
+REWRITE_CACHE_SIZE = 4096
+
+# marks source lines of a cached block, relative to the block first line
+LINE_MARKER = re.compile('\x00(-?\\d+)\x00')
+
+# memoized fragments are translated at this indentation, their indents are then stored relative to it
+MEMO_INDENTATION = 256
+MEMO_INDENT = re.compile('\n( {%d,})' % (4 * MEMO_INDENTATION // 2))
+# relative indent markers of a memoized fragment
+MEMO_LEVEL = re.compile('\x01(-?\\d+)\x01')
+# translations kept for reuse per document, bounds the memo with --stream
+MEMO_MAX_CHARS = 16 << 20
+# fragments looked up before giving up on a document without any repeated one
+MEMO_PROBE = 1024
+
+# One alternation per rewrite, applied in a single pass:
+#   ${property.x} -> ${exchangeProperty.x}, ${header.x} -> ${headers.x}
+#   ${other.reference} -> {{other.reference}} (property placeholders)
+#   " -> ', endlines are removed
+REWRITE_PATTERN = re.compile(r'\$\{(?:(property|header)\.(\w+\.?\w+)\}|[\w.]+\})|"|\n')
+REWRITE_PREFIXES = {'property': '${exchangeProperty.', 'header': '${headers.'}
+
+
+def rewrite_token(match):
+    token = match.group(0)
+    if match.group(1):
+        return REWRITE_PREFIXES[match.group(1)] + match.group(2) + '}'
+    if token == '"':
+        return "'"
+    if token == '\n':
+        return ''
+    if 'exchangeProperty' in token or 'headers' in token:
+        return token
+    return '{' + token[1:] + '}'
+
+
+@functools.lru_cache(maxsize=REWRITE_CACHE_SIZE)
+def rewrite_expression(text):
+    """Translates deprecated simple expressions of uris and expressions, cached as the same few hundred
+    endpoints and expressions are repeated all over big contexts (see rewrite_expression.cache_info())."""
+    return REWRITE_PATTERN.sub(rewrite_token, text)
+
+
+def structure_key(node):
+    """Digest of a subtree content: equal for the copies of a fragment wherever they are in the document (at the same
+    nesting depth for lxml elements, as the indentation of the source is part of their content)."""
+    content = node.canonical() if hasattr(node, 'canonical') else etree.tostring(node, with_tail=False)
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def relative_lines(node):
+    """Source lines of a subtree relative to its first line, copies with the same content can still differ by the
+    comments removed from them."""
+    base = node.sourceline
+    return [element.sourceline - base for element in node.iter()]
+
+
+class MemoEntry:
+    """Translation of a repeated fragment, rendered as a %-template per indentation with the source lines as
+    arguments."""
+    __slots__ = ('structure', 'text', 'change', 'diagnostics', 'lines', 'templates')
+
+    def __init__(self, structure, text, change, diagnostics):
+        self.structure = structure  # relative_lines() of the fragment
+        self.text = text.replace('%', '%%')
+        self.change = change
+        self.diagnostics = diagnostics
+        self.lines = [int(line) for line in LINE_MARKER.findall(text)]
+        self.templates = {}
+
+    def render(self, indentation, absolute):
+        """Template of the fragment at indentation, with absolute source lines or markers relative to a block."""
+        template = self.templates.get((indentation, absolute))
+        if template is None:
+            def indent(marker):
+                level = indentation + int(marker.group(1))
+                return INDENTS[level] if 0 <= level < len(INDENTS) else '\n' + ' ' * 4 * level
+            template = LINE_MARKER.sub('%d' if absolute else '\x00%d\x00', MEMO_LEVEL.sub(indent, self.text))
+            self.templates[(indentation, absolute)] = template
+        return template
+
+
+class ConversionError(Exception):
+    """Error on an element of the source document, its tag and source line."""
+
+    def __init__(self, node, detail=None):
+        self.tag = node.tag
+        self.sourceline = node.sourceline
+        self.detail = detail
+        super().__init__(self.describe())
+
+    def describe(self):
+        return f'{self.tag} (source line: {self.sourceline})'
+
+    def __reduce__(self):
+        # raised in --jobs workers and pickled back to the main process
+        return type(self), (types.SimpleNamespace(tag=self.tag, sourceline=self.sourceline), self.detail)
+
+
+class UnsupportedElementError(ConversionError):
+
+    def describe(self):
+        return f'unknown node {self.tag} (source line: {self.sourceline})'
+
+
+class UnresolvedReferenceError(ConversionError):
+
+    def describe(self):
+        return f'unresolved reference {self.detail} of {self.tag} (source line: {self.sourceline})'
+
+
+class ImportCycleError(ConversionError):
+
+    def describe(self):
+        return f'import cycle {self.detail} (source line: {self.sourceline})'
+
+
+# diagnostics of --keep-going / --check, errors are the constructs translated to a TODO placeholder, the --optimize
+# rewrites are recorded as info
+DIAGNOSTIC_LEVELS = {'unsupported': 'error', 'invalid': 'error', 'missing-ref': 'error', 'import-cycle': 'error',
+                     'deprecated': 'warning', 'optimized': 'info'}
+
+# id of the thread pool profile every camel context defines
+DEFAULT_THREAD_POOL_PROFILE = 'defaultThreadPoolProfile'
+
+# camel 2 constructs rewritten by the converter, reported as deprecated
+DEPRECATED_EXPRESSION = re.compile(r'\$\{(?:property|header)\.')
+
+# --optimize: toD uris evaluated per message, simple expressions (${...} or $simple{...}) and language: expressions
+DYNAMIC_URI = re.compile(r'\$(?:simple)?\{|\Alanguage:')
+
+# --optimize: the split size is only set on the last part of a streaming split
+SPLIT_SIZE = re.compile(r'CamelSplitSize|SPLIT_SIZE')
+
+# --optimize: simple expressions reading a single header or property, evaluated without the simple language
+VALUE_EXPRESSION = re.compile(r'\$\{(headers|exchangeProperty)\.(\w+)\}')
+VALUE_BUILDERS = {'headers': 'header', 'exchangeProperty': 'exchangeProperty'}
+
+
+def local_name(tag):
+    return tag.rpartition('}')[2]
+
+
+# '\n' + 4 spaces per level, precomputed so indent() does not rebuild the prefix on every call
+INDENTS = tuple('\n' + ' ' * 4 * level for level in range(32))
+
+
+class DslWriter:
+    """Append-only sink for the generated dsl.
+
+    Text is collected as a list of chunks and joined once; when a stream is given the chunks are written out and
+    released on every flush() (the converter flushes after each route), so the output is never held in memory.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.chunks = []
+
+    def write(self, text):
+        if text:
+            self.chunks.append(text)
+
+    def flush(self):
+        if self.stream is not None and self.chunks:
+            self.stream.write(''.join(self.chunks))
+            self.chunks.clear()
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+class NullWriter(DslWriter):
+    """Output of --check, the handlers only run for their diagnostics."""
+
+    def write(self, text):
+        pass
+
+
+class VersionAction(argparse.Action):
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings, dest=dest, default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser.exit(message=f'xml2dsl {version()}\n')
+
+
+TARGETS = ('java', 'yaml')
+
+
+def parse_targets(value):
+    targets = [target.strip() for target in value.split(',') if target.strip()]
+    unknown = [target for target in targets if target not in TARGETS]
+    if unknown or not targets:
+        raise argparse.ArgumentTypeError(f'unknown target {", ".join(unknown)}, expected {", ".join(TARGETS)}')
+    return targets
+
+
+def build_arg_parser():
+    import configargparse
+
+    p = configargparse.ArgParser(
+        description="Transforms xml routes to dsl routes")
+    p.add_argument('--version', action=VersionAction, help='show the version and exit')
+    p.add_argument('--plain', action='store_true',
+                   help='plain log lines instead of rich formatting (default when stderr is not a terminal)',
+                   env_var='XML2DSL_PLAIN')
+    p.add_argument('--xml', metavar='xml', type=str,
+                   help='xml camel context file', required=False, env_var='XML_CTX_INPUT')
+    p.add_argument('--beans', metavar='beans', type=str,
+                   help='use beans instead processors', required=False, env_var='USE_BEANS')
+    p.add_argument('--xml-dir', metavar='xml_dir', type=str,
+                   help='convert every *.xml file found under this directory', required=False,
+                   env_var='XML_CTX_INPUT_DIR')
+    p.add_argument('--glob', metavar='glob', type=str,
+                   help='convert every file matching this glob pattern (supports **)', required=False,
+                   env_var='XML_CTX_INPUT_GLOB')
+    p.add_argument('--xml-list', metavar='xml_list', type=str,
+                   help='file listing one xml camel context path per line', required=False,
+                   env_var='XML_CTX_INPUT_LIST')
+    p.add_argument('--output-dir', metavar='output_dir', type=str,
+                   help='directory where batch mode writes one .java file per input; with --xml, one class per '
+                        'camelContext below the --package folders', required=False, env_var='DSL_OUTPUT_DIR')
+    p.add_argument('--package', metavar='package', type=str, default='xml2dsl',
+                   help='java package of the generated classes', env_var='XML2DSL_PACKAGE')
+    p.add_argument('--target', metavar='target', type=parse_targets, default='java',
+                   help=f'comma separated output targets among {", ".join(TARGETS)}, several targets need '
+                        f'--output-dir', env_var='XML2DSL_TARGET')
+    p.add_argument('--shard-routes', metavar='routes', type=int,
+                   help='with --output-dir, spread the routes of a camelContext over RouteBuilder classes of at most '
+                        'this many routes', required=False, env_var='XML2DSL_SHARD_ROUTES')
+    p.add_argument('--shard-size', metavar='KB', type=int,
+                   help='with --output-dir, start a new RouteBuilder class when the configure() code would exceed '
+                        'this size', required=False, env_var='XML2DSL_SHARD_SIZE')
+    p.add_argument('--workers', metavar='workers', type=int,
+                   help='size of the batch mode process pool (defaults to the cpu count)', required=False,
+                   env_var='XML2DSL_WORKERS')
+    p.add_argument('--output', metavar='output', type=str,
+                   help='write the generated class to this file instead of stdout', required=False,
+                   env_var='DSL_OUTPUT')
+    p.add_argument('--quiet', action='store_true',
+                   help='only log errors', env_var='XML2DSL_QUIET')
+    p.add_argument('--verbose', action='store_true',
+                   help='trace every translated node (slow, for debugging)', env_var='XML2DSL_VERBOSE')
+    p.add_argument('--cache-dir', metavar='cache_dir', type=str,
+                   help='reuse the translation of unchanged routes from this directory', required=False,
+                   env_var='XML2DSL_CACHE_DIR')
+    p.add_argument('--cache-max-mb', metavar='cache_max_mb', type=int, default=512,
+                   help='evict least recently used cache entries above this size', env_var='XML2DSL_CACHE_MAX_MB')
+    p.add_argument('--no-cache', action='store_true',
+                   help='ignore --cache-dir', env_var='XML2DSL_NO_CACHE')
+    p.add_argument('--serve', action='store_true',
+                   help='keep a warm process answering json-lines conversion requests on stdin (or --socket)',
+                   env_var='XML2DSL_SERVE')
+    p.add_argument('--socket', metavar='socket', type=str,
+                   help='with --serve, listen on this unix socket instead of stdin', required=False,
+                   env_var='XML2DSL_SOCKET')
+    p.add_argument('--stream', action='store_true',
+                   help='translate one route at a time with iterparse, keeps memory bounded on huge contexts',
+                   env_var='XML2DSL_STREAM')
+    p.add_argument('--jobs', metavar='jobs', type=int, default=1,
+                   help='translate the routes of one file in this many processes, joined in document order',
+                   env_var='XML2DSL_JOBS')
+    p.add_argument('--groovy-resources', metavar='groovy_resources', type=str,
+                   help='write groovy blocks as .groovy classpath resources under this directory (e.g. '
+                        'src/main/resources) instead of String fields', required=False,
+                   env_var='XML2DSL_GROOVY_RESOURCES')
+    p.add_argument('--keep-going', action='store_true',
+                   help='write a TODO placeholder for unsupported elements and unresolved references instead of '
+                        'stopping at the first one', env_var='XML2DSL_KEEP_GOING')
+    p.add_argument('--check', action='store_true',
+                   help='only report unsupported elements, unresolved references and deprecated constructs, '
+                        'no code is generated', env_var='XML2DSL_CHECK')
+    p.add_argument('--report', metavar='report', type=str,
+                   help='write the --keep-going / --check diagnostics to this json file (--check prints them to '
+                        'stdout otherwise)', required=False, env_var='XML2DSL_REPORT')
+    p.add_argument('--profile', metavar='profile', type=str,
+                   help='write per handler calls, times and output plus the parse / translate / write times to '
+                        'this json file, and the handler stacks next to it as .folded (flamegraph input)',
+                   required=False, env_var='XML2DSL_PROFILE')
+    p.add_argument('--cprofile', metavar='cprofile', type=str,
+                   help='dump the cProfile stats of the conversion to this file', required=False,
+                   env_var='XML2DSL_CPROFILE')
+    p.add_argument('--classpath', metavar='classpath', type=str,
+                   help=f'{os.pathsep} separated roots of the classpath: spring imports (e.g. src/main/resources)',
+                   required=False, env_var='XML2DSL_CLASSPATH')
+    p.add_argument('--graph', metavar='graph', type=str,
+                   help='write the route call graph analysis (entry points, unreachable routes, cycles, fan-in / '
+                        'fan-out hot spots, dangling and dynamic endpoints) to this json file', required=False,
+                   env_var='XML2DSL_GRAPH')
+    p.add_argument('--optimize', action='store_true',
+                   help='rewrite slow constructs into faster equivalents (toD with a constant uri, simple expressions '
+                        'reading a header or property, split by tokens without streaming), every rewrite is logged',
+                   env_var='XML2DSL_OPTIMIZE')
+    p.add_argument('--prune', action='store_true',
+                   help='leave out the routes no entry point can reach through direct:, seda: or vm: endpoints',
+                   env_var='XML2DSL_PRUNE')
+    return p
+
+
+def write_atomic(path, text):
+    """Write text to path through a temporary file, readers never see a partially written file."""
+    import tempfile
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, "w") as tmp:
+            tmp.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# inputs from this size are parsed straight from a memory map of the file
+MMAP_THRESHOLD = 16 << 20
+# huge_tree lifts the libxml2 limit of 256 nested elements, generated routes go deeper
+PARSER_OPTIONS = {'remove_comments': True, 'huge_tree': True}
+
+# app.war!/WEB-INF/classes/camel-context.xml, an xml entry read from its archive without extracting it
+ARCHIVE_SEPARATOR = '!/'
+ARCHIVE_SUFFIXES = ('.jar', '.war', '.ear', '.zip')
+
+BUFFERS = (bytes, bytearray, memoryview)
+
+
+@contextlib.contextmanager
+def open_source(source):
+    """Binary input of a conversion: a path lxml reads itself, the xml entry of an archive or a .gz file
+    decompressed on the fly, a bytes buffer or a binary file object, every one of them seekable."""
+    if isinstance(source, BUFFERS):
+        yield io.BytesIO(source)
+        return
+    if not isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+
+    source = os.fspath(source)
+    archive, separator, entry = source.partition(ARCHIVE_SEPARATOR)
+    if separator:
+        import zipfile
+        with zipfile.ZipFile(archive) as zip_file, zip_file.open(entry) as xml_file:
+            yield xml_file
+    elif source.endswith('.gz'):
+        import gzip
+        with gzip.open(source, 'rb') as xml_file:
+            yield xml_file
+    else:
+        yield source
+
+
+def parse_document(source, parser):
+    """Root element of source (see open_source), large files are parsed from a memory map instead of read."""
+    if isinstance(source, BUFFERS):
+        return etree.fromstring(source, parser)
+    with open_source(source) as xml:
+        if isinstance(xml, str) and os.path.getsize(xml) >= MMAP_THRESHOLD:
+            import mmap
+            with open(xml, 'rb') as xml_file, \
+                    mmap.mmap(xml_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                return etree.fromstring(view, parser)
+        return etree.parse(xml, parser).getroot()
+
+
+# files written at the same time by --output-dir
+OUTPUT_WRITERS = 4
+
+JAVA_PACKAGE = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)*$')
+
+
+def java_class_name(context_id, position):
+    """Java class name for a camelContext id, ctx-BT_route -> CtxBTRoute."""
+    name = ''.join(part[:1].upper() + part[1:] for part in re.split(r'[^0-9A-Za-z]+', context_id or ''))
+    if not name:
+        return f'CamelContext{position}'
+    return f'Context{name}' if name[0].isdigit() else name
+
+
+def groovy_source(node):
+    return node.text or ''
+
+
+# classpath folder of the --groovy-resources scripts, next to the generated xml2dsl package
+GROOVY_RESOURCE_DIR = 'xml2dsl/groovy'
+
+
+def groovy_resource(text):
+    """Classpath location of a groovy script, named by its content so the output is reproducible."""
+    return f'{GROOVY_RESOURCE_DIR}/{hashlib.sha256(text.encode()).hexdigest()[:16]}.groovy'
+
+
+def reads_split_size(node):
+    """Whether the text or an attribute of node (comments included, to stay on the safe side) reads the split size."""
+    if node.text and SPLIT_SIZE.search(node.text):
+        return True
+    return isinstance(node.tag, str) and any(SPLIT_SIZE.search(value) for value in node.attrib.values())
+
+
+class BlockTranslator:
+    """Translates camelContext blocks as they are submitted, parallel.ParallelTranslator is the --jobs version."""
+
+    def __init__(self, converter):
+        self.converter = converter
+
+    def submit(self, node):
+        with self.converter.block_output(node.tag):
+            self.converter.translate_block(node)
+        self.converter.out.flush()
+
+    def finish(self):
+        pass
+
+
+class DocumentIndex:
+    """Lookup tables of a document, filled in one pass before translation starts.
+
+    Handlers resolve beans, endpoints and groovy fields with a dict lookup, so references declared after their
+    first use (an ``<endpoint>`` at the end of the context) resolve as well.
+    """
+
+    BEAN = qualified_tag('bean', ns['beans'])
+    CONTEXT = qualified_tag('camelContext')
+    DATA_FORMATS = qualified_tag('dataFormats')
+    ENDPOINT = qualified_tag('endpoint')
+    GROOVY = qualified_tag('groovy')
+    IMPORT = qualified_tag('import', ns['beans'])
+    ROUTE = qualified_tag('route')
+    THREAD_POOL = qualified_tag('threadPool')
+    THREAD_POOL_PROFILE = qualified_tag('threadPoolProfile')
+    TAGS = (BEAN, CONTEXT, DATA_FORMATS, ENDPOINT, GROOVY, IMPORT, ROUTE, THREAD_POOL, THREAD_POOL_PROFILE)
+
+    def __init__(self):
+        self.beans = {}  # id -> class
+        self.endpoints = {}  # id -> uri
+        self.data_formats = {}  # id -> data format element
+        self.groovy = {}  # script -> field index, in first occurrence order with the last occurrence index
+        self.groovy_count = 0
+        self.thread_pool_profiles = {}  # id -> attributes
+        self.thread_pools = {}  # id -> attributes of the shared <threadPool> executor services
+        self.route_ids = {}  # id -> source line
+        self.contexts = []  # ids of the top level camelContexts, None without id
+        self.context_groovy = []  # groovy scripts of every top level camelContext
+        self.imports = []  # (resource, source line) of the spring <import> elements
+        self.split_size = False  # an expression or uri of the document reads CamelSplitSize
+
+    @classmethod
+    def from_tree(cls, root, split_size=False):
+        """Index the tree, split_size looks for the reads of CamelSplitSize in the text and attributes of every
+        element (--optimize)."""
+        index = cls()
+        if split_size:
+            index.split_size = any(map(reads_split_size, root.iter()))
+        for node in root.iter(*cls.TAGS):
+            index.add(node)
+            if node.tag == cls.GROOVY:
+                index.add_groovy(node)
+            elif node.tag == cls.DATA_FORMATS:
+                for data_format in node:
+                    index.add_data_format(data_format)
+        return index
+
+    @classmethod
+    def from_events(cls, events, release, split_size=False):
+        """Index (start, end) iterparse events, release(node) is called on every end event."""
+        index = cls()
+        depth = 0
+        data_formats_depth = None
+        for event, node in events:
+            if event == 'start':
+                depth += 1
+                if depth == data_formats_depth:
+                    index.add_data_format(node)
+                elif node.tag == cls.DATA_FORMATS:
+                    data_formats_depth = depth + 1
+                else:
+                    index.add(node)
+                continue
+
+            depth -= 1
+            if split_size and reads_split_size(node):
+                index.split_size = True
+                split_size = False
+            if node.tag == cls.GROOVY:
+                index.add_groovy(node)
+            elif node.tag == cls.DATA_FORMATS:
+                data_formats_depth = None
+            release(node)
+        return index
+
+    def add(self, node):
+        """Index the attributes of node, available from the start tag."""
+        tag = node.tag
+        if tag == self.BEAN:
+            bean_id, bean_type = node.get('id'), node.get('class')
+            if bean_id and bean_type and 'PropertyPlaceholderConfigurer' not in bean_type:
+                self.beans[bean_id] = bean_type
+        elif tag == self.ENDPOINT:
+            endpoint_id, uri = node.get('id'), node.get('uri')
+            if endpoint_id and uri:
+                self.endpoints[endpoint_id] = uri
+        elif tag == self.ROUTE:
+            if 'id' in node.attrib:
+                self.route_ids[node.attrib['id']] = node.sourceline
+        elif tag == self.IMPORT:
+            if 'resource' in node.attrib:
+                self.imports.append((node.attrib['resource'], node.sourceline))
+        elif tag == self.THREAD_POOL_PROFILE:
+            if 'id' in node.attrib:
+                self.thread_pool_profiles[node.attrib['id']] = dict(node.attrib)
+        elif tag == self.THREAD_POOL:
+            if 'id' in node.attrib:
+                self.thread_pools[node.attrib['id']] = dict(node.attrib)
+        elif tag == self.CONTEXT:
+            parent = node.getparent()
+            if parent is not None and parent.getparent() is None:
+                self.contexts.append(node.get('id'))
+                self.context_groovy.append({})
+
+    def add_data_format(self, node):
+        if isinstance(node.tag, str) and 'id' in node.attrib:
+            self.data_formats[node.attrib['id']] = etree.QName(node).localname
+
+    def add_groovy(self, node):
+        text = groovy_source(node)
+        self.groovy[text] = self.groovy_count
+        self.groovy_count += 1
+        if self.context_groovy:
+            self.context_groovy[-1][text] = None
+
+    def class_name(self):
+        # every context goes into one class named after the last one
+        if not self.contexts:
+            return None
+        return Converter.context_class_name(len(self.contexts) - 1, self.contexts[-1])
+
+    def java_class_names(self):
+        """Unique class names of the top level camelContexts, for one class per context."""
+        names = []
+        for position, context_id in enumerate(self.contexts):
+            name = java_class_name(context_id, position)
+            names.append(f'{name}{position}' if name in names else name)
+        return names
+
+    def digest(self):
+        """Digest of the tables a translation reads, part of the translation cache key."""
+        tables = json.dumps([sorted(self.beans.items()), sorted(self.endpoints.items()), list(self.groovy.items()),
+                             sorted(self.thread_pool_profiles), sorted(self.thread_pools), self.split_size])
+        return hashlib.sha256(tables.encode()).hexdigest()
 
 
 class Converter:
@@ -28,7 +684,7 @@ class Converter:
 
     CLASS_TEMPLATE = '''
 ///////////////
-package xml2dsl;
+package >>> package <<<;
 
 import org.apache.camel.ExchangePattern;
 import org.apache.camel.builder.RouteBuilder;
@@ -50,112 +706,682 @@ public class >>> class name <<< extends RouteBuilder {
 }
     '''
 
-    def __init__(self):
-        self.dsl_route = ''
-        self.endpoints = {}
-        self.bean_refs = {}
+    CLASS_HEAD, CLASS_TAIL = CLASS_TEMPLATE.split('>>> routes <<<')
+
+    _dispatch_table = None
+    _dispatch_generation = -1
+
+    @classmethod
+    def dispatch_table(cls):
+        """Qualified tag -> handler function, built once per class from the *_def methods and registrations."""
+        if cls.__dict__.get('_dispatch_generation') != _registry_generation:
+            table = {}
+            for klass in reversed(cls.__mro__):
+                table.update((qualified_tag(name[:-4]), handler) for name, handler in vars(klass).items()
+                             if name.endswith('_def'))
+            table.update(_registered_handlers)
+            cls._dispatch_table = table
+            cls._dispatch_generation = _registry_generation
+        return cls._dispatch_table
+
+    # camelContext children whose translation is cached with --cache-dir
+    CACHED_BLOCKS = frozenset(qualified_tag(name) for name in ('route', 'onException', 'dataFormats'))
+
+    # elements repeated verbatim across routes, translated once per document and reused
+    MEMO_TAGS = frozenset(qualified_tag(name) for name in ('onException', 'doTry', 'choice'))
+
+    # options changing the generated code, part of the cache key
+    OUTPUT_OPTIONS = ('beans', 'groovy_resources', 'optimize')
+
+    def __init__(self, options=None):
+        self.handlers = {tag: handler.__get__(self, type(self))
+                         for tag, handler in type(self).dispatch_table().items()}
+        self.profiler = None
+        self.configure(options if options is not None else build_arg_parser().parse_args([]))
+        self.out = DslWriter()
+        self.index = DocumentIndex()
         self.indentation = 2
-        self.groovy_transformations = {}
-
-    def xml_to_dsl(self):
-        p = configargparse.ArgParser(
-            description="Transforms xml routes to dsl routes " + __version__)
-        p.add_argument('--xml', metavar='xml', type=str,
-                       help='xml camel context file', required=True, env_var='XML_CTX_INPUT')
-        p.add_argument('--beans', metavar='beans', type=str,
-                       help='use beans instead processors', required=False, env_var='USE_BEANS')
-        args = p.parse_args()
-        with open(args.xml, "r") as xml_file:
-            parser = etree.XMLParser(remove_comments=True)
-            data = objectify.parse(xml_file, parser=parser)
-            console.log(" XML 2 DSL Utility ", style="bold red")
-            root = data.getroot()
-
-            # Beans
-            bean_definitions = []
-            for bean in root.findall('.//beans:bean', ns):
-                name = bean.attrib['id']
-                bean_type = bean.attrib['class']
-                if 'PropertyPlaceholderConfigurer' in bean_type:
-                    continue
-
-                self.bean_refs[name] = bean_type
-
-                bean = Converter.BEAN_TEMPLATE \
-                    .replace('>>> bean type <<<', bean_type) \
-                    .replace('>>> bean name <<<', name)
-
-                bean_definitions.append(bean)
-
-            # Multiline groovy transforms
-            for idx, node in enumerate(root.findall('.//camel:groovy', ns)):
-                code_hash, text = self.preformat_groovy_transformation(node)
-                transformed = Converter.GROOVY_TEMPLATE \
-                    .replace('>>> index <<<', str(idx)) \
-                    .replace('>>> transformed <<<', ' + \n'.join(self.process_multiline_groovy(text)) + ';')
-
-                self.groovy_transformations[code_hash] = {
-                    'index': idx,
-                    'transformation': transformed
-                }
-
-            # Camel Contexts
-            for idx, camelContext in enumerate(root.findall('camel:camelContext', ns)):
-                if 'id' in camelContext.attrib:
-                    console.log("processing camel context", camelContext.attrib['id'])
-
-                class_name = camelContext.attrib['id'] if 'id' in camelContext.attrib else f'camelContext{str(idx)}'
-                class_name = class_name.capitalize()
-
-                self.get_namespaces(camelContext)
-                self.dsl_route += self.analyze_node(camelContext)
+        self.line_base = None
+        self.cache_context = None
+        self.shards = None
+        self.graph = None
+        self.pruned = None
+        self.diagnostics = []
+        self.reset_memo()
+
+    def configure(self, options):
+        self.options = options
+        self.log_level = log_level(options)
+        self.trace = self.log_level >= VERBOSE
+        self.targets = getattr(options, 'target', None) or ['java']
+        self.java = 'java' in self.targets
+        self.checking = getattr(options, 'check', False)
+        self.sharding = bool(getattr(options, 'shard_routes', None) or getattr(options, 'shard_size', None))
+        self.keep_going = self.checking or getattr(options, 'keep_going', False)
+        self.optimize = getattr(options, 'optimize', False)
+        self.graphing = bool(getattr(options, 'graph', None) or getattr(options, 'prune', False))
+        if getattr(options, 'profile', None):
+            self.enable_profiling()
+        self.cache = None
+        if options.cache_dir and not options.no_cache:
+            from xml2dsl.cache import TranslationCache
+            fingerprint = json.dumps([version(), self.keep_going] +
+                                     [getattr(options, name, None) for name in self.OUTPUT_OPTIONS])
+            self.cache = TranslationCache(options.cache_dir, options.cache_max_mb * 1024 * 1024, fingerprint)
+
+    def xml_to_dsl(self, args=None):
+        if args is None:
+            args = build_arg_parser().parse_args()
+        self.configure(args)
+        if self.checking:
+            self.write_report(self.check(args.xml), args.report)
+            return
+        if args.output_dir:
+            for path in self.convert_to_directory(args.xml, args.output_dir):
+                self.log("written", path)
+        elif args.output:
+            with open(args.output, "w") as output:
+                self.convert(args.xml, output)
+        elif not self.java:
+            self.convert(args.xml, sys.stdout)
+        else:
+            sys.stdout.write("dsl route:\n ")
+            self.convert(args.xml, sys.stdout)
+            sys.stdout.write("\n")
+        if self.keep_going:
+            report = self.report(args.xml)
+            self.log(f"{report['errors']} unsupported elements or unresolved references, "
+                     f"{report['warnings']} deprecated constructs")
+            if args.report:
+                self.write_report(report, args.report)
+        if self.profiler is not None and args.profile:
+            self.write_profile(args.profile)
+
+    def convert(self, source, stream=None):
+        """Translate source (a path, an ``archive.jar!/entry.xml`` path, bytes or a binary file object), the class is
+        written to stream as routes finish or returned when no stream is given."""
+        if len(self.targets) > 1:
+            raise ValueError('several targets are written with convert_targets or convert_to_directory (--output-dir)')
+        self.convert_targets(source, {self.targets[0]: stream})
+        return self.out.getvalue() if stream is None else None
+
+    def convert_targets(self, source, streams):
+        """Translate source once for every target, streams maps the targets to the text streams their output is
+        written to as routes finish."""
+        if self.sharding and self.java:
+            raise ValueError('sharded classes are written with convert_to_directory (--output-dir)')
+        self.target_outputs = {target: DslWriter(streams[target]) if self.profiler is None
+                               else self.profiler.writer(streams[target]) for target in self.targets}
+        self.out = self.target_outputs['java' if self.java else self.targets[0]]
+        self.cache_context = None
+        self.class_files = None
+        self.translate_document(source)
+        if self.java:
+            self.out.write(Converter.CLASS_TAIL)
+        for out in self.target_outputs.values():
+            out.flush()
+
+    def convert_to_directory(self, source, output_dir):
+        """One RouteBuilder class per top level camelContext, written to output_dir/<package folders>/<class>.java
+        by a small thread pool while the next context is translated. Returns the written paths."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.cache_context = None
+        self.output_dir = output_dir
+        self.package_dir = os.path.join(output_dir, *self.options.package.split('.'))
+        self.class_files = []
+        with ThreadPoolExecutor(max_workers=OUTPUT_WRITERS) as self.writers:
+            self.translate_document(source)
+        return [class_file.result() for class_file in self.class_files]
+
+    def check(self, source):
+        """Run the handlers over source for their diagnostics only, returns the report()."""
+        self.out = NullWriter()
+        self.cache_context = None
+        self.class_files = None
+        self.translate_document(source)
+        return self.report(source)
+
+    def report(self, source=None):
+        """Diagnostics of the last conversion with their counts per kind and tag."""
+        counts = {}
+        errors = warnings = 0
+        for diagnostic in self.diagnostics:
+            tags = counts.setdefault(diagnostic['kind'], {})
+            tags[diagnostic['tag']] = tags.get(diagnostic['tag'], 0) + 1
+            errors += diagnostic['level'] == 'error'
+            warnings += diagnostic['level'] == 'warning'
+        return {
+            'xml': source if isinstance(source, str) else None,
+            'errors': errors,
+            'warnings': warnings,
+            'counts': counts,
+            'diagnostics': self.diagnostics
+        }
 
-            groovy_transformations = '\n\n'.join([v['transformation'] for k, v in self.groovy_transformations.items()])
+    @staticmethod
+    def write_report(report, path=None):
+        text = json.dumps(report, indent=2) + '\n'
+        if path:
+            write_atomic(path, text)
+        else:
+            sys.stdout.write(text)
+
+    def diagnose(self, kind, node, message, level=None):
+        # relative to the block in translate_detached, like the quoted source lines
+        line = node.sourceline if self.line_base is None else node.sourceline - self.line_base
+        self.diagnostics.append({'level': level or DIAGNOSTIC_LEVELS[kind], 'kind': kind, 'tag': local_name(node.tag),
+                                 'line': line, 'message': message})
+
+    def enable_profiling(self):
+        """Instrument the handlers, returns the profiling.Profiler (also self.profiler) keeping the counters of
+        every following conversion."""
+        if self.profiler is None:
+            from xml2dsl.profiling import Profiler
+            self.profiler = Profiler()
+            self.profiler.instrument(self)
+        return self.profiler
+
+    def write_profile(self, path):
+        write_atomic(path, json.dumps(self.profiler.report(), indent=2) + '\n')
+        write_atomic(os.path.splitext(path)[0] + '.folded', self.profiler.collapsed())
+
+    def translate_document(self, source):
+        self.diagnostics = []
+        self.source = source
+        self.reset_memo()
+        with self.profiler.timed('total') if self.profiler is not None else contextlib.nullcontext():
+            if self.options.stream:
+                self.convert_streaming(source)
+            else:
+                self.convert_tree(source)
+        if self.cache is not None:
+            self.log(f"cache: {self.cache.hits} hits, {self.cache.misses} misses")
+        if self.memo_hits:
+            self.log(f"memo: {self.memo_hits} hits, {self.memo_misses} misses")
+        if self.optimize:
+            for diagnostic in self.diagnostics:
+                if diagnostic['kind'] == 'optimized':
+                    self.log(f"optimized {diagnostic['tag']} (source line: {diagnostic['line']}): "
+                             f"{diagnostic['message']}")
+
+    def begin_document(self):
+        """Called once the document index is built, before the first context."""
+        if self.index.imports:
+            self.import_beans()
+        if self.graph is not None:
+            self.analyze_graph()
+        self.emitters = []
+        self.copy_block = None
+        if 'yaml' in self.targets and not self.checking:
+            from xml2dsl.ir import from_lxml
+            from xml2dsl.yaml_dsl import YamlEmitter
+            # the document output when converting to a stream, a writer per context with --output-dir
+            self.emitters.append(YamlEmitter(self.index, self.target_outputs['yaml'] if self.class_files is None
+                                             else None))
+            self.copy_block = from_lxml
+        if self.options.groovy_resources and self.java and not self.checking:
+            self.write_groovy_resources()
+        if self.class_files is None and self.java:
+            self.write_class_head()
+
+    def import_beans(self):
+        """Add the beans of the spring imports to the index, the beans of the document win."""
+        from xml2dsl import imports
+
+        def error(kind, importing, line, detail):
+            node = types.SimpleNamespace(tag=DocumentIndex.IMPORT, sourceline=line)
+            if importing != path:
+                detail = f'{detail} imported from {importing}'
+            if kind == 'missing-ref':
+                # only the beans of the resource are missing, their references are reported on their own
+                self.log(f"unresolved import {detail} (source line: {line})")
+                self.diagnose(kind, node, f'unresolved import {detail}', level='warning')
+                return
+            if not self.keep_going:
+                raise ImportCycleError(node, detail)
+            self.diagnose(kind, node, f'import cycle {detail}')
+
+        path = imports.normalize(os.fspath(self.source)) if isinstance(self.source, (str, os.PathLike)) else None
+        classpath = [root for root in (getattr(self.options, 'classpath', None) or '').split(os.pathsep) if root]
+        for name, bean_type in imports.imported_beans(path, self.index.imports, classpath, error).items():
+            self.index.beans.setdefault(name, bean_type)
+
+    def analyze_graph(self):
+        report = self.graph.analyze(self.index.endpoints)
+        self.log(f"graph: {report['routes']} routes, {len(report['unreachable'])} unreachable, "
+                 f"{len(report['cycles'])} cycles")
+        if getattr(self.options, 'graph', None):
+            write_atomic(self.options.graph, json.dumps(report, indent=2) + '\n')
+        self.pruned = set(self.graph.unreachable) if getattr(self.options, 'prune', False) else None
+        self.route_position = 0
+        self.graph = None
+
+    def begin_context(self, position, camelContext):
+        if 'id' in camelContext.attrib:
+            self.log("processing camel context", camelContext.attrib['id'])
+        self.get_namespaces(camelContext)
+        if self.class_files is not None:
+            for emitter in self.emitters:
+                emitter.out = DslWriter()
+        if self.class_files is not None and self.java:
+            self.out = DslWriter()
+            self.indentation = 2
+            if self.sharding:
+                from xml2dsl.shards import Shards
+                shard_size = getattr(self.options, 'shard_size', None)
+                self.shards = Shards(self, self.options.shard_routes, shard_size and shard_size * 1024)
+            else:
+                self.write_class_head(position)
+
+    def block_output(self, tag):
+        """Around the write of a camelContext block to self.out, where --shard-* cut the classes."""
+        return self.shards.block(tag) if self.shards is not None else contextlib.nullcontext()
+
+    def submit_block(self, translator, node):
+        if self.pruned and node.tag == DocumentIndex.ROUTE:
+            self.route_position += 1
+            if self.route_position - 1 in self.pruned:
+                return
+        # with other targets the block is copied to the ir once and every target translates the copy
+        if self.copy_block is not None:
+            node = self.copy_block(node)
+            for emitter in self.emitters:
+                emitter.translate_block(node)
+                emitter.out.flush()
+        if self.java:
+            translator.submit(node)
+
+    def end_context(self, position, translator):
+        if self.class_files is None:
+            return
+
+        class_name = self.index.java_class_names()[position]
+        if self.java:
+            translator.finish()
+            if self.shards is None:
+                self.out.write(Converter.CLASS_TAIL)
+                classes = [(class_name, self.out.getvalue())]
+            else:
+                classes = self.shards.classes(class_name, self.index.context_groovy[position])
+                self.shards = None
+            for name, text in classes:
+                path = os.path.join(self.package_dir, name + '.java')
+                self.class_files.append(self.writers.submit(self.write_class_file, path, text))
+        for emitter in self.emitters:
+            path = os.path.join(self.output_dir, class_name + emitter.SUFFIX)
+            self.class_files.append(self.writers.submit(self.write_class_file, path, emitter.out.getvalue()))
+            emitter.out = None
+
+    def write_class_file(self, path, text):
+        with self.profiler.timed('background_write') if self.profiler is not None else contextlib.nullcontext():
+            write_atomic(path, text)
+        return path
+
+    def convert_tree(self, source):
+        root = parse_document(source, etree.XMLParser(**PARSER_OPTIONS))
+        self.log(" XML 2 DSL Utility ", style="bold red")
+        self.index = DocumentIndex.from_tree(root, self.optimize)
+        if self.graphing:
+            from xml2dsl.graph import RouteGraph
+            self.graph = RouteGraph.from_tree(root)
+        self.begin_document()
+
+        with self.block_translator() as translator:
+            for position, camelContext in enumerate(root.iterchildren(DocumentIndex.CONTEXT)):
+                self.begin_context(position, camelContext)
+                for child in camelContext:
+                    self.submit_block(translator, child)
+                self.end_context(position, translator)
+
+    def convert_streaming(self, source):
+        """Same output as convert_tree, but the document is never fully loaded.
+
+        A first iterparse pass builds the document index, the second one translates every
+        direct child of a camelContext (routes, onException, rest...) as soon as its end tag is read and then frees
+        it, so peak memory is bounded by the largest route instead of the whole file.
+        """
+        self.log(" XML 2 DSL Utility ", style="bold red")
+        with open_source(source) as xml:
+            events = etree.iterparse(xml, events=('start', 'end'), **PARSER_OPTIONS)
+            if self.graphing:
+                from xml2dsl.graph import RouteGraph
+                self.graph = RouteGraph()
+                events = self.graph.observe(events)
+            self.index = DocumentIndex.from_events(events, self.release, self.optimize)
+            self.begin_document()
+
+            if not isinstance(xml, str):
+                xml.seek(0)
+            self.translate_events(etree.iterparse(xml, events=('start', 'end'), **PARSER_OPTIONS))
+
+    def translate_events(self, events):
+        # second --stream pass, every camelContext child is translated and released at its end tag
+        context_tag = DocumentIndex.CONTEXT
+        depth = 0
+        position = -1
+        with self.block_translator() as translator:
+            for event, node in events:
+                if event == 'start':
+                    depth += 1
+                    if depth == 2 and node.tag == context_tag:
+                        position += 1
+                        self.begin_context(position, node)
+                    continue
 
-            dsl_route = Converter.CLASS_TEMPLATE \
-                .replace(">>> groovy transformations <<<", groovy_transformations) \
-                .replace(">>> beans <<<", ''.join(bean_definitions)) \
-                .replace(">>> class name <<<", class_name) \
-                .replace(">>> routes <<<", self.dsl_route)
+                depth -= 1
+                if depth == 2 and node.getparent().tag == context_tag:
+                    self.submit_block(translator, node)
+                elif depth == 1 and node.tag == context_tag:
+                    self.end_context(position, translator)
+                if depth <= 2:
+                    self.release(node)
 
-            print("dsl route:\n", dsl_route)
+    @staticmethod
+    def context_class_name(idx, context_id):
+        class_name = context_id if context_id is not None else f'camelContext{str(idx)}'
+        return class_name.capitalize()
 
     @staticmethod
-    def get_namespaces(node):
-        console.log("namespaces:", node.nsmap)
+    def release(node):
+        # drop the subtree and the already processed siblings, the parents keep growing otherwise
+        node.clear(keep_tail=True)
+        parent = node.getparent()
+        if parent is not None:
+            while node.getprevious() is not None:
+                del parent[0]
+
+    def groovy_transformation(self, idx, text):
+        text = text.replace('"', '\'')
+        return Converter.GROOVY_TEMPLATE \
+            .replace('>>> index <<<', str(idx)) \
+            .replace('>>> transformed <<<', ' + \n'.join(self.process_multiline_groovy(text)) + ';')
+
+    def write_groovy_resources(self):
+        # content addressed, an existing script is already up to date
+        for text in self.index.groovy:
+            path = os.path.join(self.options.groovy_resources, *groovy_resource(text).split('/'))
+            if not os.path.exists(path):
+                write_atomic(path, text)
+
+    def write_class_head(self, position=None):
+        """Head of the class of every context, or of the context at position with --output-dir."""
+        if position is None:
+            class_name = self.index.class_name()
+            scripts = self.index.groovy
+        else:
+            class_name = self.index.java_class_names()[position]
+            scripts = self.index.context_groovy[position]
 
-    def analyze_node(self, node):
-        dslText = ""
-        for child in node:
-            node_name = child.tag.partition('}')[2]
+        self.out.write(self.class_head(class_name, scripts, self.index.beans))
 
-            # Skip property placeholders
-            if node_name == 'propertyPlaceholder':
-                continue
+    def class_head(self, class_name, scripts, beans):
+        """Class head declaring the groovy fields of scripts and autowiring beans (id -> class)."""
+        if self.options.groovy_resources:
+            groovy_transformations = ''
+        else:
+            groovy_transformations = '\n\n'.join(self.groovy_transformation(self.index.groovy[text], text)
+                                                 for text in scripts)
+        bean_definitions = ''.join(Converter.BEAN_TEMPLATE
+                                   .replace('>>> bean type <<<', bean_type)
+                                   .replace('>>> bean name <<<', name)
+                                   for name, bean_type in beans.items())
+
+        return (Converter.CLASS_HEAD
+                .replace(">>> groovy transformations <<<", groovy_transformations)
+                .replace(">>> beans <<<", bean_definitions)
+                .replace(">>> package <<<", self.options.package)
+                .replace(">>> class name <<<", class_name))
+
+    def get_namespaces(self, node):
+        if self.trace:
+            console.log("namespaces:", node.nsmap)
+
+    def log(self, *objects, style=None):
+        if self.log_level >= NORMAL:
+            console.log(*objects, style=style)
+
+    def translate_block(self, node):
+        """Translate a direct child of a camelContext, going through the translation cache when enabled."""
+        if self.cache is None or node.tag not in self.CACHED_BLOCKS:
+            self.analyze_child(node)
+            return
+
+        key = self.cache_key(node)
+        if not self.translate_cached(key, node):
+            entry = self.translate_detached(node, self.indentation)
+            self.cache.put(key, *entry)
+            self.write_translation(entry, node.sourceline)
+
+    def translate_cached(self, key, node):
+        """Write the cached translation of node, returns False on a cache miss."""
+        entry = self.cache.get(key)
+        if entry is None:
+            return False
+        self.write_translation(entry, node.sourceline)
+        return True
+
+    def cache_key(self, node):
+        if self.cache_context is None:
+            self.cache_context = self.index.digest()
+        return self.cache.key(node, f'{self.indentation}:{self.cache_context}')
+
+    def translate_detached(self, node, indentation):
+        """Translate a camelContext block as a function of the block, the document index and the options only.
+
+        Returns the text, with source lines relative to the block first line, the indentation change and the
+        diagnostics (relative lines as well); the converter output, indentation and diagnostics are left untouched,
+        so blocks can be translated in any order or process.
+        """
+        out, saved_indentation, diagnostics = self.out, self.indentation, self.diagnostics
+        self.out, self.indentation, self.line_base, self.diagnostics = DslWriter(), indentation, node.sourceline, []
+        try:
+            self.analyze_child(node)
+            return self.out.getvalue(), self.indentation - indentation, self.diagnostics
+        finally:
+            self.out, self.indentation, self.line_base, self.diagnostics = out, saved_indentation, None, diagnostics
+
+    def reset_memo(self):
+        self.memo = {}  # structure_key() -> memoized translation, None for the fragments seen once
+        self.memo_chars = 0
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.memo_scope = self.MEMO_TAGS  # tags looked up in this document
+        self.memo_tags = self.memo_scope  # tags looked up at this point, none within a fragment
+
+    def translate_memoized(self, node):
+        """Translate a fragment repeated across routes (onException, doTry, choice) once per document: copies
+        reuse the text of the previous one at their own indentation and source lines. Returns False for the first
+        copy, translated as usual as most fragments are not repeated."""
+        key = structure_key(node)
+        entry = self.memo.get(key, False)
+        if entry:
+            if entry.structure != relative_lines(node):
+                self.memo_misses += 1
+                return False
+            self.memo_hits += 1
+        else:
+            self.memo_misses += 1
+            if self.memo_misses >= MEMO_PROBE and not self.memo_hits:
+                self.memo_scope = frozenset()  # the digests cost more than they save
+                return False
+            if self.memo_chars >= MEMO_MAX_CHARS:
+                return False
+            if entry is False:
+                self.memo[key] = None
+                return False
+            self.memo[key] = entry = self.record_fragment(node)
+            self.memo_chars += len(entry.text)
+        self.write_fragment(node, entry)
+        return True
+
+    def write_fragment(self, node, entry):
+        """Write the MemoEntry of a fragment at the indentation and source lines of node."""
+        offset = node.sourceline if self.line_base is None else node.sourceline - self.line_base
+        self.out.write(entry.render(self.indentation, self.line_base is None) % tuple([offset + line
+                                                                                      for line in entry.lines]))
+        self.indentation += entry.change
+        self.diagnostics.extend(dict(diagnostic, line=offset + diagnostic['line']) for diagnostic in entry.diagnostics)
+
+    def first_copy(self, node):
+        """Handler result translating the first copy of a fragment, the fragments nested in it are not looked up:
+        they are rarely repeated when the fragment is not."""
+        self.memo_tags = frozenset()
+        try:
+            result = self.analyze_element(node)
+            if type(result) is not types.GeneratorType:
+                self.out.write(result)
+                return
+            yield from result
+        finally:
+            self.memo_tags = self.memo_scope
+
+    def record_fragment(self, node):
+        """MemoEntry of node, translated with indents and source lines relative to node."""
+        saved = self.out, self.indentation, self.line_base, self.diagnostics
+        self.out, self.indentation, self.line_base = DslWriter(), MEMO_INDENTATION, node.sourceline
+        self.diagnostics = []
+        self.memo_tags = frozenset()  # nested fragments are part of this one
+        try:
+            self.walk((node,))
+            text = MEMO_INDENT.sub(lambda indent: f'\x01{len(indent.group(1)) // 4 - MEMO_INDENTATION}\x01',
+                                   self.out.getvalue())
+            return MemoEntry(relative_lines(node), text, self.indentation - MEMO_INDENTATION, self.diagnostics)
+        finally:
+            self.out, self.indentation, self.line_base, self.diagnostics = saved
+            self.memo_tags = self.memo_scope
+
+    def write_translation(self, entry, base):
+        """Append a translate_detached() result of the block starting at source line base."""
+        text, indentation, diagnostics = entry
+        self.indentation += indentation
+        self.out.write(LINE_MARKER.sub(lambda line: str(base + int(line.group(1))), text))
+        self.diagnostics.extend(dict(diagnostic, line=base + diagnostic['line']) for diagnostic in diagnostics)
+
+    @contextlib.contextmanager
+    def block_translator(self):
+        """Yields the translator of camelContext blocks, a process pool writing in document order with --jobs."""
+        jobs = getattr(self.options, 'jobs', None) or 1
+        if jobs <= 1 or not self.java or self.profiler is not None:  # handlers are profiled in process
+            yield BlockTranslator(self)
+            return
+
+        from xml2dsl.parallel import ParallelTranslator
+        translator = ParallelTranslator(self, jobs)
+        try:
+            yield translator
+            translator.finish()
+        finally:
+            translator.shutdown()
+
+    def source_line(self, node):
+        if self.line_base is None:
+            return str(node.sourceline)
+        return f'\x00{node.sourceline - self.line_base}\x00'
+
+    def analyze_node(self, node, skip=0):
+        # the tree is never modified, expressions already translated by the handler are skipped
+        self.walk(node[skip:] if skip else node)
+
+    def analyze_child(self, child):
+        self.walk((child,))
+
+    def walk(self, nodes):
+        """Translate nodes and their subtrees with an explicit stack, whatever the nesting depth.
+
+        Handlers either return their text, which is appended here, or are generators (containers): they write the
+        opening of the element to self.out, yield the children to translate and close the element once resumed,
+        they can yield several times. The stack holds the suspended handlers with their remaining children.
+        """
+        write = self.out.write
+        keep_going = self.keep_going
+        stack = [(None, iter(nodes))]
+        while stack:
+            block, children = stack[-1]
+            for child in children:
+                # output and indentation to restore when the handler of child fails with --keep-going
+                started = keep_going and (len(self.out.chunks), self.indentation)
+                try:
+                    if child.tag not in self.memo_tags:
+                        result = self.analyze_element(child)
+                    elif self.translate_memoized(child):
+                        continue
+                    else:
+                        result = self.first_copy(child)
+                    if type(result) is not types.GeneratorType:
+                        write(result)
+                        continue
+                    opened = next(result, None)
+                except Exception as error:
+                    if not keep_going:
+                        raise
+                    write(self.invalid(child, error, *started))
+                    continue
+                if opened is not None:
+                    stack.append((result, iter(opened)))
+                    break
+            else:
+                stack.pop()
+                if block is not None:
+                    children = next(block, None)
+                    if children is not None:
+                        stack.append((block, iter(children)))
 
-            process_function_name = node_name + "_def"
-            console.log("processing node", node_name, child.tag, child.sourceline)
-            next_node = getattr(self, process_function_name, None)
-            if next_node is None:
-                console.log("unknown node", process_function_name, child.sourceline)
-                sys.exit(1)
-            dslText += getattr(self, process_function_name)(child)
-        return dslText
+    @staticmethod
+    def nested(nodes):
+        """Handler result translating nodes after the text the handler already wrote."""
+        yield nodes
 
     def analyze_element(self, node):
-        node_name = node.tag.partition('}')[2] + "_def"
-        console.log("processing node", node_name, node.tag, node.sourceline)
-        return getattr(self, node_name)(node)
+        if self.trace:
+            console.log("processing node", node.tag, node.sourceline)
+        handler = self.handlers.get(node.tag)
+        if handler is None:
+            handler = self.entry_point_handler(node)
+        return handler(node)
+
+    def entry_point_handler(self, node):
+        handler = load_entry_point_handlers().get(node.tag)
+        if handler is None:
+            if self.keep_going:
+                return self.unsupported
+            raise UnsupportedElementError(node)
+        self.handlers[node.tag] = handler = handler.__get__(self, type(self))
+        return handler
+
+    def unsupported(self, node):
+        # --keep-going placeholder of elements without handler
+        self.diagnose('unsupported', node, f'no translation for {node.tag}')
+        return self.indent(f'// TODO unsupported {local_name(node.tag)} (source line {self.source_line(node)})')
+
+    def invalid(self, node, error, chunks, indentation):
+        # --keep-going placeholder of elements whose handler failed (missing attribute or child...), replacing what
+        # the handler wrote
+        del self.out.chunks[chunks:]
+        self.indentation = indentation
+        message = f'{type(error).__name__}: {error}'.replace('\n', ' ')
+        self.diagnose('invalid', node, message)
+        return self.indent(f'// TODO invalid {local_name(node.tag)} (source line {self.source_line(node)}): {message}')
+
+    def unresolved(self, node, ref):
+        """Comment closing the line of an unresolved reference with --keep-going, raises otherwise."""
+        if not self.keep_going:
+            raise UnresolvedReferenceError(node, ref)
+        self.diagnose('missing-ref', node, f'unresolved reference {ref}')
+        return f' // TODO unresolved reference {ref} (source line {self.source_line(node)})'
+
+    def propertyPlaceholder_def(self, node):
+        # property placeholders are resolved by the spring boot configuration
+        return None
 
     def route_def(self, node):
-        route_def = self.analyze_node(node)
-        route_def += self.indent('.end();\n')
-        self.indentation -= 1
-        return route_def
+        indentation = self.indentation
+        yield node  # from_def indents the steps following it
+        self.emit('.end();\n')
+        self.indentation = indentation
 
     def dataFormats_def(self, node):
-        dataformats = self.analyze_node(node)
-        return dataformats
+        yield node
 
     def json_def(self, node):
         name = node.attrib['id']
@@ -174,29 +1400,28 @@ public class >>> class name <<< extends RouteBuilder {
         return json_dataformat + '\n'
 
     def endpoint_def(self, node):
-        endpoint_id = node.attrib['id']
-        uri = node.attrib['uri']
-        self.endpoints[endpoint_id] = uri
+        # resolved from the document index by to_definition
         return ""
 
     def multicast_def(self, node):
-        multicast_def = self.indent('.multicast()')
+        self.emit(f'.multicast(){self.parallel_processing(node)}')
         self.indentation += 1
-        multicast_def += self.analyze_node(node)
+        yield node
         self.indentation -= 1
-        multicast_def += self.indent('.end() // end multicast')
-        return multicast_def
+        self.emit('.end() // end multicast')
 
     def bean_def(self, node):
         ref = node.attrib['ref']
-        method = node.attrib['method']
-        return self.indent(f'.bean({self.bean_refs[ref]}.class, "{method}")')
+        method = node.get('method')
+        method = f', "{method}"' if method else ''
+        if ref not in self.index.beans:
+            return self.indent(f'.bean("{ref}"{method})') + self.unresolved(node, ref)
+        return self.indent(f'.bean({self.index.beans[ref]}.class{method})')
 
     def recipientList_def(self, node):
-        recipient_def = self.indent('.recipientList().')
-        recipient_def += self.analyze_node(node)
-        recipient_def += self.indent('.end() // end recipientList')
-        return recipient_def
+        self.emit('.recipientList().')
+        yield node
+        self.emit('.end() // end recipientList')
 
     def errorHandler_def(self, node):
         if node.attrib['type'] == "DefaultErrorHandler":
@@ -220,16 +1445,13 @@ public class >>> class name <<< extends RouteBuilder {
         return policy_def
 
     def onException_def(self, node):
-        exceptions = []
-        for exception in node.findall("camel:exception", ns):
-            exceptions.append(exception.text + ".class")
-            node.remove(exception)
-        exceptions = ','.join(exceptions)
-        onException_def = self.indent('onException(' + exceptions + ')')
+        exceptions, options, steps = self.exception_children(node, self.ON_EXCEPTION_OPTIONS)
+        handled = options.get(self.HANDLED_TAG)
+        redeliveryPolicy = options.get(self.REDELIVERY_POLICY_TAG)
+        onException_def = self.indent('onException(' + ','.join(exceptions) + ')')
 
         indented = False
 
-        handled = node.find("camel:handled", ns)
         if handled is not None:
             if not indented:
                 self.indentation += 1
@@ -237,9 +1459,6 @@ public class >>> class name <<< extends RouteBuilder {
 
             onException_def += self.indent('.handled(' + handled[0].text + ')')
 
-            node.remove(handled)
-
-        redeliveryPolicy = node.find('camel:redeliveryPolicy', ns)
         if redeliveryPolicy is not None:
             if not indented:
                 self.indentation += 1
@@ -255,68 +1474,65 @@ public class >>> class name <<< extends RouteBuilder {
             onException_def += self.indent('.retriesExhaustedLogLevel(LoggingLevel.' +
                                            redeliveryPolicy.attrib['retriesExhaustedLogLevel'] +
                                            ')' if 'retriesExhaustedLogLevel' in redeliveryPolicy.attrib else '')
-            node.remove(redeliveryPolicy)
 
         if 'redeliveryPolicyRef' in node.attrib:
             onException_def += self.indent('.redeliveryPolicy(policy)')
 
-        onException_def += self.analyze_node(node)
-        onException_def += self.indent('.end();\n')
+        self.out.write(onException_def)
+        yield steps
+        self.emit('.end();\n')
 
         if indented:
             self.indentation -= 1
 
-        return onException_def
-
     def description_def(self, node):
         return self.indent(f'.description("{node.text}")')
 
     def from_def(self, node):
-        routeFrom = self.deprecatedProcessor(node.attrib['uri'])
+        routeFrom = self.deprecatedProcessor(node.attrib['uri'], node)
         routeId = node.getparent().attrib['id'] if 'id' in node.getparent().keys() else routeFrom
-        from_def = self.indent(f'from("{routeFrom}")')
+        self.emit(f'from("{routeFrom}")')
         self.indentation += 1
-        from_def += self.indent(f'.routeId("{routeId}")')
-        from_def += self.analyze_node(node)
-        return from_def
+        self.emit(f'.routeId("{routeId}")')
+        yield node
 
     def log_def(self, node):
-        message = self.deprecatedProcessor(node.attrib['message'])
+        message = self.deprecatedProcessor(node.attrib['message'], node)
         if 'loggingLevel' in node.attrib and node.attrib['loggingLevel'] != 'INFO':
             return self.indent(f'.log(LoggingLevel.{node.attrib["loggingLevel"]}, "{message}"){self.handle_id(node)}')
         else:
             return self.indent(f'.log("{message}"){self.handle_id(node)}')
 
     def choice_def(self, node):
-        choice_def = self.indent(f'.choice(){self.handle_id(node)} // (source line: {str(node.sourceline)})')
+        self.emit(f'.choice(){self.handle_id(node)} // (source line: {self.source_line(node)})')
         self.indentation += 1
-        choice_def += self.analyze_node(node)
+        yield node
         self.indentation -= 1
 
-        choice_def += self.indent(f'.end() // end choice (source line: {str(node.sourceline)})')
-
-        return choice_def
+        self.emit(f'.end() // end choice (source line: {self.source_line(node)})')
 
     def when_def(self, node):
-        when_def = self.indent('.when(' + self.analyze_element(node[0]) + ')' + self.handle_id(node))
-        node.remove(node[0])
+        self.emit('.when(' + self.analyze_element(node[0]) + ')' + self.handle_id(node))
         self.indentation += 1
-        when_def += self.analyze_node(node)
+        yield node[1:]
         self.indentation -= 1
-        when_def += self.indent(f'.endChoice() // (source line: {str(node.sourceline)})')
-        return when_def
+        self.emit(f'.endChoice() // (source line: {self.source_line(node)})')
 
     def otherwise_def(self, node):
-        otherwise_def = self.indent(f'.otherwise(){self.handle_id(node)}')
+        self.emit(f'.otherwise(){self.handle_id(node)}')
         self.indentation += 1
-        otherwise_def += self.analyze_node(node)
+        yield node
         self.indentation -= 1
-        otherwise_def += self.indent(f'.endChoice() // (source line: {str(node.sourceline)})')
-        return otherwise_def
+        self.emit(f'.endChoice() // (source line: {self.source_line(node)})')
 
     def simple_def(self, node):
         result_type = f', {node.attrib["resultType"]}.class' if 'resultType' in node.attrib else ''
-        expression = self.deprecatedProcessor(node.text) if node.text is not None else ''
+        expression = self.deprecatedProcessor(node.text, node) if node.text is not None else ''
+        value = VALUE_EXPRESSION.fullmatch(expression.strip()) if self.optimize and not result_type else None
+        if value is not None:
+            builder = f'{VALUE_BUILDERS[value.group(1)]}("{value.group(2)}")'
+            self.diagnose('optimized', node, f'simple("{expression.strip()}") -> {builder}')
+            return builder + self.handle_id(node)
         return f'simple("{expression.strip()}"{result_type}){self.handle_id(node)}'
 
     def constant_def(self, node):
@@ -324,9 +1540,10 @@ public class >>> class name <<< extends RouteBuilder {
         return f'constant("{expression}"){self.handle_id(node)}'
 
     def groovy_def(self, node):
-        code_hash, text = self.preformat_groovy_transformation(node)
-        groovy_transformation = self.groovy_transformations[code_hash]
-        return f'groovy(groovy_{str(groovy_transformation["index"])}){self.handle_id(node)}'
+        text = groovy_source(node)
+        if self.options.groovy_resources:
+            return f'groovy("resource:classpath:{groovy_resource(text)}"){self.handle_id(node)}'
+        return f'groovy(groovy_{self.index.groovy[text]}){self.handle_id(node)}'
 
     def xpath_def(self, node):
         result_type = f', {node.attrib["resultType"]}.class' if 'resultType' in node.attrib else ''
@@ -340,17 +1557,25 @@ public class >>> class name <<< extends RouteBuilder {
 
     def to_definition(self, node, to_type):
         uri = self.componentOptions(node.attrib['uri'])
+        unresolved = ''
         if 'ref:' in uri:
-            uri = self.endpoints[uri[4:]]
+            if uri[4:] in self.index.endpoints:
+                uri = self.index.endpoints[uri[4:]]
+            else:
+                unresolved = self.unresolved(node, uri[4:])
 
-        uri = self.deprecatedProcessor(uri)
+        uri = self.deprecatedProcessor(uri, node)
+        if to_type == 'toD' and self.optimize and not DYNAMIC_URI.search(uri):
+            # property placeholders ({{...}}) are resolved once at startup, only simple expressions need toD
+            self.diagnose('optimized', node, f'toD("{uri}") with a constant uri -> to')
+            to_type = 'to'
 
         pattern = node.attrib['pattern'] if 'pattern' in node.attrib else ''
         exchangePattern = f'ExchangePattern.{pattern}, ' if pattern and pattern in ['InOnly', 'InOut'] else ''
 
         node_id = self.handle_id(node)
 
-        return self.indent(f'.{to_type}({exchangePattern}"{uri}"){node_id}')
+        return self.indent(f'.{to_type}({exchangePattern}"{uri}"){node_id}{unresolved}')
 
     def to_def(self, node):
         return self.to_definition(node, 'to')
@@ -371,13 +1596,15 @@ public class >>> class name <<< extends RouteBuilder {
         if 'ref' in node.attrib:
             return self.indent(f'.unmarshal({node.attrib["ref"]})')
         else:
-            return self.indent('.unmarshal()' + self.analyze_node(node))
+            self.emit('.unmarshal()')
+            return self.nested(node)
 
     def marshal_def(self, node):
         if 'ref' in node.attrib:
             return self.indent(f'.marshal({node.attrib["ref"]}){self.handle_id(node)}')
         else:
-            return self.indent(f'.marshal(){self.handle_id(node)}' + self.analyze_node(node))
+            self.emit(f'.marshal(){self.handle_id(node)}')
+            return self.nested(node)
 
     def jaxb_def(self, node):
         if 'prettyPrint' in node.attrib:
@@ -390,10 +1617,14 @@ public class >>> class name <<< extends RouteBuilder {
 
     def setHeader_def(self, node):
         name_attrib = 'headerName' if 'headerName' in node.attrib else 'name'
+        if name_attrib == 'headerName' and self.keep_going:
+            self.diagnose('deprecated', node, 'headerName attribute, renamed name in camel 3')
         return self.set_expression(node, 'setHeader', node.attrib[name_attrib])
 
     def setProperty_def(self, node):
         name_attrib = 'propertyName' if 'propertyName' in node.attrib else 'name'
+        if name_attrib == 'propertyName' and self.keep_going:
+            self.diagnose('deprecated', node, 'propertyName attribute, renamed name in camel 3')
         return self.set_expression(node, 'setProperty', node.attrib[name_attrib])
 
     def setExchangePattern_def(self, node):
@@ -403,24 +1634,33 @@ public class >>> class name <<< extends RouteBuilder {
         return self.indent(f'.process({node.attrib["ref"]}){self.handle_id(node)}')
 
     def inOnly_def(self, node):
+        if self.keep_going:
+            self.diagnose('deprecated', node, 'inOnly was removed in camel 3, use <to pattern="InOnly">')
         return self.indent(f'.inOnly("{node.attrib["uri"]}")')
 
+    # split expressions iterating over the payload, which do not need it in memory with streaming()
+    STREAMING_SPLITS = frozenset(qualified_tag(name) for name in ('tokenize', 'xtokenize'))
+
     def split_def(self, node):
         expression = self.analyze_element(node[0])
-        node.remove(node[0])  # remove first child as was processed
 
         split_def = self.indent(f'.split({expression})')
         if 'streaming' in node.attrib:
             split_def += '.streaming()'
+        elif (self.optimize and node[0].tag in self.STREAMING_SPLITS and node.get('parallelProcessing') != 'true'
+              and not self.index.split_size):
+            # tokens are read from the payload as the parts are processed, the parts keep their order but
+            # CamelSplitSize is only known on the last one
+            self.diagnose('optimized', node, f'split({expression}) -> streaming')
+            split_def += '.streaming()'
         if 'strategyRef' in node.attrib:
             split_def += f'.aggregationStrategy({node.attrib["strategyRef"]})'
-        if 'parallelProcessing' in node.attrib:
-            split_def += '.parallelProcessing()'
+        split_def += self.parallel_processing(node)
+        self.out.write(split_def)
         self.indentation += 1
-        split_def += self.analyze_node(node)
+        yield node[1:]
         self.indentation -= 1
-        split_def += self.indent('.end() // end split')
-        return split_def
+        self.emit('.end() // end split')
 
     def removeHeaders_def(self, node):
         exclude_pattern = ', "' + node.attrib['excludePattern'] + '"' if 'excludePattern' in node.attrib else ''
@@ -433,37 +1673,28 @@ public class >>> class name <<< extends RouteBuilder {
         return f'xquery("{node.text}") // xquery not finished please review'
 
     def doTry_def(self, node):
-        doTry_def = self.indent(f'.doTry(){self.handle_id(node)}')
+        self.emit(f'.doTry(){self.handle_id(node)}')
         self.indentation += 1
-        doTry_def += self.analyze_node(node)
+        yield node
         self.indentation -= 1
-        doTry_def += self.indent(f'.endDoTry() // (source line: {str(node.sourceline)})')
-        return doTry_def
+        self.emit(f'.endDoTry() // (source line: {self.source_line(node)})')
 
     def doCatch_def(self, node):
-        exceptions = []
-        for exception in node.findall("camel:exception", ns):
-            exceptions.append(exception.text + ".class")
-            node.remove(exception)
-        exceptions = ', '.join(exceptions)
-
-        doCatch_def = self.indent(f'.doCatch({exceptions}){self.handle_id(node)}')
+        exceptions, _, steps = self.exception_children(node)
+        self.emit(f'.doCatch({", ".join(exceptions)}){self.handle_id(node)}')
 
         self.indentation += 1
-        doCatch_def += self.analyze_node(node)
+        yield steps
         self.indentation -= 1
-        return doCatch_def
 
     def onWhen_def(self, node):
         onWhen_predicate = self.analyze_element(node[0])
-        node.remove(node[0])
         return f'.onWhen({onWhen_predicate})'
 
     def doFinally_def(self, node):
         self.indentation += 1
-        doFinally_Def = self.analyze_node(node)
+        yield node
         self.indentation -= 1
-        return doFinally_Def
 
     def handled_def(self, node):
         return '.handled(' + node[0].text + ')'
@@ -473,10 +1704,7 @@ public class >>> class name <<< extends RouteBuilder {
         return self.indent(f'.transacted({transacted_ref}){self.handle_id(node)}')
 
     def wireTap_def(self, node):
-        if 'executorServiceRef' in node.attrib:
-            return self.indent(f'.wireTap("{node.attrib["uri"]}"){self.handle_id(node)}.executorServiceRef("profile")')
-        else:
-            return self.indent(f'.wireTap("{node.attrib["uri"]}"){self.handle_id(node)}')
+        return self.indent(f'.wireTap("{node.attrib["uri"]}"){self.handle_id(node)}{self.executor_service(node)}')
 
     def language_def(self, node):
         return 'language("' + node.attrib['language'] + '","' + node.text + '")'
@@ -489,65 +1717,103 @@ public class >>> class name <<< extends RouteBuilder {
             poolSize = maxPoolSize
         if poolSize is not None and maxPoolSize is None:
             maxPoolSize = poolSize
-        if 'threadName' in node.attrib:
+        if 'executorServiceRef' in node.attrib or poolSize is None:
+            # the referenced executor service replaces the pool options, like in xml
+            threads_def = '\n.threads()' + self.executor_service(node)
+        elif 'threadName' in node.attrib:
             threads_def = '\n.threads(' + poolSize + ',' + maxPoolSize + ',"' + node.attrib['threadName'] + '")'
         else:
             threads_def = '\n.threads(' + poolSize + ',' + maxPoolSize + ')'
 
-        threads_def += self.analyze_node(node)
-        threads_def += "\n.end() //end threads"
-        return threads_def
+        self.out.write(threads_def)
+        yield node
+        self.out.write("\n.end() //end threads")
 
     def delay_def(self, node):
-        delay_def = '\n.delay().'
-        delay_def += self.analyze_node(node)
-        return delay_def
+        self.out.write('\n.delay().')
+        return self.nested(node)
 
     def javaScript_def(self, node):
         return 'new JavaScriptExpression("' + node.text + '")'
 
     def threadPoolProfile_def(self, node):
-        profileDef = '\nThreadPoolProfile profile = new ThreadPoolProfile();'
-        if 'defaultProfile' in node.attrib:
-            profileDef += '\nprofile.setDefaultProfile(' + node.attrib['defaultProfile'] + ');'
-        if 'id' in node.attrib:
-            profileDef += '\nprofile.setId("' + node.attrib['id'] + '");'
+        # registered with the context: every executorServiceRef to the profile creates a pool of it, like in xml
+        default = node.get('defaultProfile') == 'true'
+        register = 'setDefaultThreadPoolProfile' if default else 'registerThreadPoolProfile'
+        profile_def = self.indent(f'getContext().getExecutorServiceManager().{register}(')
+        self.indentation += 1
+        profile_def += self.indent(f'new org.apache.camel.builder.ThreadPoolProfileBuilder("{node.attrib["id"]}")')
+        profile_def += self.thread_pool_options(node, '.build());')
+        self.indentation -= 1
+        return profile_def + '\n'
+
+    def threadPool_def(self, node):
+        # one executor service shared by every executorServiceRef to its id
+        build = 'buildScheduled' if node.get('scheduled') == 'true' else 'build'
+        thread_name = node.get('threadName', node.attrib['id'])
+        pool_def = self.indent(f'getContext().getRegistry().bind("{node.attrib["id"]}",')
+        self.indentation += 1
+        pool_def += self.indent('new org.apache.camel.builder.ThreadPoolBuilder(getContext())')
+        pool_def += self.thread_pool_options(node, f'.{build}(this, "{thread_name}"));')
+        self.indentation -= 1
+        return pool_def + '\n'
+
+    # threadPoolProfile / threadPool attribute -> builder method, enum type of its value
+    THREAD_POOL_OPTIONS = (('poolSize', None), ('maxPoolSize', None), ('maxQueueSize', None),
+                           ('allowCoreThreadTimeOut', None),
+                           ('rejectedPolicy', 'org.apache.camel.ThreadPoolRejectedPolicy'))
+
+    def thread_pool_options(self, node, build):
+        """Builder calls of the pool options of node, ending with the build call."""
+        self.indentation += 1
+        options = ''
+        for attribute, enum in self.THREAD_POOL_OPTIONS:
+            if attribute in node.attrib:
+                value = f'{enum}.{node.attrib[attribute]}' if enum else node.attrib[attribute]
+                options += self.indent(f'.{attribute}({value})')
         if 'keepAliveTime' in node.attrib:
-            profileDef += '\nprofile.setKeepAliveTime(' + node.attrib['keepAliveTime'] + 'L);'
-        if 'maxPoolSize' in node.attrib:
-            profileDef += '\nprofile.setMaxPoolSize(' + node.attrib['maxPoolSize'] + ');'
-        if 'maxQueueSize' in node.attrib:
-            profileDef += '\nprofile.setMaxQueueSize(' + node.attrib['maxQueueSize'] + ');'
-        if 'poolSize' in node.attrib:
-            profileDef += '\nprofile.setPoolSize(' + node.attrib['poolSize'] + ');'
-        if 'rejectedPolicy' in node.attrib:
-            if node.attrib['rejectedPolicy'] == 'Abort':
-                profileDef += '\nprofile.setRejectedPolicy(ThreadPoolRejectedPolicy.Abort);'
-        return profileDef
+            time_unit = node.get('timeUnit')
+            time_unit = f', java.util.concurrent.TimeUnit.{time_unit}' if time_unit else ''
+            options += self.indent(f'.keepAliveTime({node.attrib["keepAliveTime"]}L{time_unit})')
+        options += self.indent(build)
+        self.indentation -= 1
+        return options
+
+    def executor_service(self, node):
+        """.executorServiceRef() of node, the id of a threadPoolProfile, a threadPool or a spring bean."""
+        ref = node.get('executorServiceRef')
+        if ref is None:
+            return ''
+        index = self.index
+        if ref in index.thread_pool_profiles or ref in index.thread_pools or ref in index.beans \
+                or ref == DEFAULT_THREAD_POOL_PROFILE:
+            return f'.executorServiceRef("{ref}")'
+        return f'.executorServiceRef("{ref}")' + self.unresolved(node, ref)
+
+    def parallel_processing(self, node):
+        parallel = '.parallelProcessing()' if node.get('parallelProcessing') == 'true' else ''
+        return parallel + self.executor_service(node)
 
     def throwException_def(self, node):
         has_ref = 'ref' in node.attrib
         exception_type = '' if has_ref else node.attrib['exceptionType']
         message = f'TODO: Please review, throwException has changed with Java DSL (source line: ' \
-                  + str(node.sourceline) \
+                  + self.source_line(node) \
                   + ')"' \
             if has_ref else node.attrib['message']
 
-        throwException_def = self.indent(f'.throwException({exception_type}.class, "{message}"){self.handle_id(node)}')
-        throwException_def += self.analyze_node(node)
-        return throwException_def
+        self.emit(f'.throwException({exception_type}.class, "{message}"){self.handle_id(node)}')
+        return self.nested(node)
 
     def spel_def(self, node):
         return 'SpelExpression.spel("' + node.text + '")'
 
     def loop_def(self, node):
-        loop_def = self.indent(f'.loop({self.analyze_element(node[0])}){self.handle_id(node)}')
-        node.remove(node[0])
+        self.emit(f'.loop({self.analyze_element(node[0])}){self.handle_id(node)}')
         self.indentation += 1
-        loop_def += self.analyze_node(node)
+        yield node[1:]
         self.indentation -= 1
-        loop_def += self.indent(f'.end() // end loop (source line: {str(node.sourceline)})')
-        return loop_def
+        self.emit(f'.end() // end loop (source line: {self.source_line(node)})')
 
     def aggregate_def(self, node):
         aggregate_def = self.indent('.aggregate()')
@@ -557,16 +1823,16 @@ public class >>> class name <<< extends RouteBuilder {
 
         if 'strategyRef' in node.attrib:
             aggregate_def += f'.aggregationStrategy({node.attrib["strategyRef"]})'
+        aggregate_def += self.parallel_processing(node)
 
-        node.remove(node[0])  # remove first child as was processed
+        self.out.write(aggregate_def)
         self.indentation += 1
-        aggregate_def += self.analyze_node(node)
+        yield node[1:]
         self.indentation -= 1
-        aggregate_def += self.indent('.end() // end aggregate')
-        return aggregate_def
+        self.emit('.end() // end aggregate')
 
     def correlationExpression_def(self, node):
-        return '.' + self.analyze_node(node)
+        return '.' + ''.join(self.analyze_element(expression) for expression in node)
 
     def tokenize_def(self, node):
         return f'tokenize("{node.attrib["token"]}")'
@@ -592,12 +1858,11 @@ public class >>> class name <<< extends RouteBuilder {
         if 'port' in node.attrib:
             rest_configuration += self.indent(f'.port({node.attrib["port"]})')
 
-        rest_configuration += self.analyze_node(node)
+        self.out.write(rest_configuration)
+        yield node
         self.indentation -= 1
 
-        rest_configuration += ';\n'
-
-        return rest_configuration
+        self.out.write(';\n')
 
     def componentProperty_def(self, node):
         return self.indent(f'.componentProperty("{node.attrib["key"]}", "{node.attrib["value"]}")')
@@ -607,13 +1872,12 @@ public class >>> class name <<< extends RouteBuilder {
 
     def rest_def(self, node):
         path = node.attrib['path'] if 'path' in node.attrib else ''
-        rest = self.indent(f'rest("{path}")' if path else 'rest()')
+        self.emit(f'rest("{path}")' if path else 'rest()')
         self.indentation += 1
-        rest += self.analyze_node(node)
+        yield node
         self.indentation -= 1
 
-        rest += ';\n'
-        return rest
+        self.out.write(';\n')
 
     def get_def(self, node):
         return self.generic_rest_def(node, 'get')
@@ -666,34 +1930,22 @@ public class >>> class name <<< extends RouteBuilder {
         if 'outType' in node.attrib:
             rest_call += self.indent(f'.outType({node.attrib["outType"]}.class)')
 
-        rest_call += self.analyze_node(node)
+        self.out.write(rest_call)
+        yield node
 
         self.indentation -= 1
 
-        return rest_call
-
     # Text deprecated processor for camel deprecated endpoints and features
-    @staticmethod
-    def deprecatedProcessor(text):
-        # exchange property in simple expressions
-        text = re.sub('\${property\.(\w+\.?\w+)}', r'${exchangeProperty.\1}', text)
-        text = re.sub('\${header\.(\w+\.?\w+)}', r'${headers.\1}', text)
-        text = re.sub('"', "'", text)  # replace all occurrences from " to '
-        text = re.sub('\n', "", text)  # remove all endlines
-
-        # convert all property references
-        for match in re.finditer(r"\$(\{[\w\.\_]+\})", text):
-            if 'exchangeProperty' not in match.group(0) and 'headers' not in match.group(0):
-                text = text.replace(match.group(0), '{' + match.group(1) + '}')
-                text = text.replace(match.group(0), f'{{{match.group(1)}}}')
-
-        return text
+    def deprecatedProcessor(self, text, node=None):
+        if self.keep_going and node is not None and DEPRECATED_EXPRESSION.search(text):
+            self.diagnose('deprecated', node, 'camel 2 ${property.*} / ${header.*} expression')
+        return rewrite_expression(text)
 
     # Text processor for apply custom options in to endpoints
     @staticmethod
     def componentOptions(text):
-        if "velocity:" in text:
-            text += "?contentCache=true"
+        if "velocity:" in text and 'contentCache=' not in text:
+            text += "&contentCache=true" if '?' in text else "?contentCache=true"
         return text
 
     def set_expression(self, node, set_method, parameter=None):
@@ -713,29 +1965,90 @@ public class >>> class name <<< extends RouteBuilder {
         indentation = '' if idx == 0 else ' ' * 16
         return f'{indentation}"{part}"'
 
+    EXCEPTION_TAG = qualified_tag('exception')
+    HANDLED_TAG = qualified_tag('handled')
+    REDELIVERY_POLICY_TAG = qualified_tag('redeliveryPolicy')
+    ON_EXCEPTION_OPTIONS = (HANDLED_TAG, REDELIVERY_POLICY_TAG)
+
     @staticmethod
-    def preformat_groovy_transformation(node):
-        text = node.text.replace('"', '\'')
-        return hash(text), text
+    def exception_children(node, option_tags=()):
+        """Sort the children of onException / doCatch in one loop: the exception classes, the first child of
+        every option tag and the remaining steps in document order."""
+        exceptions = []
+        options = {}
+        steps = []
+        for child in node:
+            if child.tag == Converter.EXCEPTION_TAG:
+                exceptions.append(child.text + ".class")
+            elif child.tag in option_tags and child.tag not in options:
+                options[child.tag] = child
+            else:
+                steps.append(child)
+        return exceptions, options, steps
 
     @staticmethod
     def handle_id(node):
         return f'.id("{node.attrib["id"]}")' if 'id' in node.attrib else ''
 
     def indent(self, text: str) -> str:
-        return '\n' + (' ' * 4 * self.indentation) + text if text else ''
-
+        if not text:
+            return ''
+        if 0 <= self.indentation < len(INDENTS):
+            return INDENTS[self.indentation] + text
+        return '\n' + (' ' * 4 * self.indentation) + text
 
-if __name__ == "__main__":
-    converter = Converter()
-    converter.xml_to_dsl()
+    def emit(self, text: str):
+        self.out.write(self.indent(text))
 
 
 def main():
-    converter = Converter()
-    converter.xml_to_dsl()
+    p = build_arg_parser()
+    args = p.parse_args()
+    if args.plain:
+        console.pretty = False
+    if args.serve:
+        from xml2dsl.server import serve
+        sys.exit(serve(args))
+    if args.xml_dir or args.glob or args.xml_list:
+        if not args.output_dir:
+            p.error('batch mode (--xml-dir, --glob, --xml-list) requires --output-dir')
+        if args.shard_routes or args.shard_size:
+            p.error('--shard-routes and --shard-size only apply to --xml')
+        if args.graph:
+            p.error('--graph only applies to --xml')
+        from xml2dsl.batch import run_batch
+        sys.exit(run_batch(args))
+    if not args.xml:
+        p.error('one of --xml, --xml-dir, --glob or --xml-list is required')
+    if args.output and args.output_dir:
+        p.error('--output and --output-dir are exclusive')
+    if len(args.target) > 1 and not args.output_dir:
+        p.error('several --target need --output-dir')
+    if (args.shard_routes or args.shard_size) and not args.output_dir:
+        p.error('--shard-routes and --shard-size need --output-dir')
+    if not JAVA_PACKAGE.match(args.package):
+        p.error(f'--package {args.package} is not a java package name')
+    converter = Converter(args)
+    try:
+        if args.cprofile:
+            import cProfile
+            profile = cProfile.Profile()
+            try:
+                profile.runcall(converter.xml_to_dsl, args)
+            finally:
+                profile.dump_stats(args.cprofile)
+        else:
+            converter.xml_to_dsl(args)
+    except ConversionError as e:
+        console.log(str(e), style="bold red")
+        sys.exit(1)
+    if args.check and converter.report()['errors']:
+        sys.exit(1)
 
 
+if __name__ == "__main__":
+    main()
+
 
 #// {{body}} -> body()
 #// {{exception.*}} -> ${exception.*}
@@ -0,0 +1,195 @@
+"""Camel YAML DSL target, fed the same ir blocks as the java converter.
+
+The YAML DSL mirrors the xml model, so elements are mapped generically: attributes become keys, expression children
+are inlined (``setBody: {simple: ...}``), branches are grouped (``choice: {when: [...], otherwise: ...}``) and the
+remaining children become ``steps``. Context level configuration without yaml equivalent (data formats, thread pool
+profiles, redelivery policy profiles...) is left as a comment.
+"""
+import functools
+import json
+
+from xml2dsl.xml2dsl import local_name, ns
+
+LANGUAGES = frozenset(('simple', 'constant', 'groovy', 'xpath', 'jsonpath', 'header', 'exchangeProperty', 'tokenize',
+                       'method', 'ref', 'spel', 'javaScript', 'language', 'xquery', 'jq', 'mvel', 'ognl', 'python'))
+# children wrapping an expression
+EXPRESSION_OPTIONS = frozenset(('correlationExpression', 'completionPredicate', 'completionSize', 'completionTimeout',
+                                'handled', 'continued', 'onWhen', 'retryWhile', 'expression'))
+REST_VERBS = frozenset(('get', 'post', 'put', 'delete', 'patch', 'head'))
+# children grouped in a list under their own name
+LISTED = REST_VERBS | frozenset(('when', 'doCatch', 'param', 'responseMessage', 'componentProperty',
+                                 'dataFormatProperty', 'endpointProperty', 'consumerProperty', 'apiProperty',
+                                 'corsHeaders'))
+SINGLE_BRANCHES = frozenset(('otherwise', 'doFinally'))
+# elements configured by their (data format) child, unmarshal: {jaxb: {...}}
+INLINE_CHILDREN = frozenset(('marshal', 'unmarshal'))
+# camel 2 attributes renamed in the camel 3 / 4 model the yaml dsl follows: references of every element, and per
+# element names
+RENAMED_REFERENCES = {'strategyRef': 'aggregationStrategy', 'strategyMethodName': 'aggregationStrategyMethodName',
+                      'strategyMethodAllowNull': 'aggregationStrategyMethodAllowNull',
+                      'executorServiceRef': 'executorService'}
+RENAMED_ATTRIBUTES = {name: {**RENAMED_REFERENCES, **renamed} for name, renamed in (
+    ('setHeader', {'headerName': 'name'}), ('removeHeader', {'headerName': 'name'}),
+    ('setProperty', {'propertyName': 'name'}), ('removeProperty', {'propertyName': 'name'}),
+    ('log', {'loggerRef': 'logger'}))}
+TOP_LEVEL = frozenset(('route', 'onException', 'restConfiguration', 'rest', 'intercept', 'interceptFrom',
+                       'interceptSendToEndpoint', 'onCompletion', 'routeConfiguration'))
+
+
+class Comment(str):
+    pass
+
+
+class YamlEmitter:
+    """Writes every block to out (a DslWriter) as soon as it is translated, the items of a sequence being dumped
+    independently."""
+    TARGET = 'yaml'
+    SUFFIX = '.camel.yaml'
+
+    def __init__(self, index, out):
+        self.index = index
+        self.out = out
+
+    def translate_block(self, node):
+        name = local_name(node.tag)
+        if not node.tag.startswith(f'{{{ns["camel"]}}}') or name not in TOP_LEVEL:
+            item = Comment(f'TODO {name} (source line: {node.sourceline}) has no yaml dsl equivalent, '
+                           f'configure it in the application')
+        elif name == 'route':
+            item = {'route': self.route(node)}
+        else:
+            item = {name: self.element(node)}
+        self.out.write(dump((item,)))
+
+    def route(self, node):
+        body = self.attributes(node)
+        source = None
+        steps = []
+        for child in node:
+            if local_name(child.tag) == 'from' and source is None:
+                source = self.attributes(child)
+            else:
+                self.add_child(body, steps, child)
+        if source is not None:
+            source['steps'] = steps
+            body['from'] = source
+        return body
+
+    def element(self, node):
+        """Value of node, built with an explicit stack: the value of every child is placed in its parent once the
+        child subtree is done, whatever the nesting depth."""
+        values = []
+        stack = [(node, self.attributes(node), [], iter(node), values.append)]
+        while stack:
+            node, body, steps, children, place = stack[-1]
+            for child in children:
+                place_child = self.placement(body, steps, child)
+                if place_child is not None:
+                    stack.append((child, self.attributes(child), [], iter(child), place_child))
+                    break
+            else:
+                stack.pop()
+                place(self.close(node, body, steps))
+        return values[0]
+
+    def close(self, node, body, steps):
+        name = local_name(node.tag)
+        if name in REST_VERBS and len(steps) == 1 and 'to' in steps[0]:
+            body['to'] = steps.pop()['to']
+        elif name in INLINE_CHILDREN:
+            for step in steps:
+                body.update(step)
+            steps = []
+        if steps:
+            body['steps'] = steps
+        if not body and node.text and node.text.strip():
+            return node.text.strip()
+        return body
+
+    def add_child(self, body, steps, child):
+        place = self.placement(body, steps, child)
+        if place is not None:
+            place(self.element(child))
+
+    def placement(self, body, steps, child):
+        """Adds the inline children (expressions, exceptions) to body, returns the function placing the value of
+        the other ones."""
+        name = local_name(child.tag)
+        if name in LANGUAGES:
+            body.update(self.expression(child))
+        elif name == 'exception':
+            body.setdefault('exception', []).append(child.text.strip())
+        elif name == 'description':
+            # a plain string in the yaml dsl, empty ones are dropped
+            text = child.text.strip() if child.text else ''
+            if text:
+                body['description'] = text
+        elif name in LISTED:
+            return body.setdefault(name, []).append
+        elif name in EXPRESSION_OPTIONS or name in SINGLE_BRANCHES or name == 'redeliveryPolicy':
+            return functools.partial(body.__setitem__, name)
+        else:
+            return lambda value: steps.append({name: value})
+        return None
+
+    def expression(self, node):
+        name = local_name(node.tag)
+        text = node.text.strip() if node.text else ''
+        if not len(node.attrib):
+            return {name: text}
+        expression = self.attributes(node)
+        if text:
+            expression['expression'] = text
+        return {name: expression}
+
+    def attributes(self, node):
+        attributes = dict(node.attrib)
+        renamed = RENAMED_ATTRIBUTES.get(local_name(node.tag), RENAMED_REFERENCES)
+        if not renamed.keys().isdisjoint(attributes):
+            attributes = {renamed.get(name, name): value for name, value in attributes.items()}
+        uri = attributes.get('uri')
+        if uri is not None and uri.startswith('ref:') and uri[4:] in self.index.endpoints:
+            attributes['uri'] = self.index.endpoints[uri[4:]]
+        return attributes
+
+
+def scalar(value):
+    # json strings are valid yaml double quoted scalars
+    return json.dumps(value, ensure_ascii=False)
+
+
+def dump(items):
+    """Yaml text of the items sequence, nested mappings and sequences are written with an explicit stack."""
+    lines = []
+    # (entries, level, entries are mapping items, line to mark as a sequence item once the mapping is written)
+    stack = [(iter(items), 0, False, None)]
+    while stack:
+        entries, level, mapping, item_line = stack[-1]
+        pad = '  ' * level
+        for entry in entries:
+            if mapping:
+                key, value = entry
+                if isinstance(value, dict) and value:
+                    lines.append(f'{pad}{key}:')
+                    stack.append((iter(value.items()), level + 1, True, None))
+                    break
+                elif isinstance(value, list) and value:
+                    lines.append(f'{pad}{key}:')
+                    stack.append((iter(value), level + 1, False, None))
+                    break
+                elif isinstance(value, (dict, list)):
+                    lines.append(f'{pad}{key}: {"{}" if isinstance(value, dict) else "[]"}')
+                else:
+                    lines.append(f'{pad}{key}: {scalar(value)}')
+            elif isinstance(entry, Comment):
+                lines.append(f'{pad}# {entry}')
+            elif isinstance(entry, dict) and entry:
+                stack.append((iter(entry.items()), level + 1, True, len(lines)))
+                break
+            else:
+                lines.append(f'{pad}- {scalar(entry)}')
+        else:
+            stack.pop()
+            if item_line is not None:
+                lines[item_line] = f'{"  " * (level - 1)}- {lines[item_line].lstrip()}'
+    return ''.join(line + '\n' for line in lines)
@@ -0,0 +1,155 @@
+
+///////////////
+package xml2dsl;
+
+import org.apache.camel.ExchangePattern;
+import org.apache.camel.builder.RouteBuilder;
+import org.apache.camel.model.dataformat.JsonDataFormat;
+import org.apache.camel.model.dataformat.JsonLibrary;
+import org.apache.camel.model.rest.RestBindingMode;
+import org.springframework.beans.factory.annotation.Autowired;
+import org.springframework.stereotype.Component;
+
+@Component
+public class Ctx-bt_route extends RouteBuilder {
+
+
+    @Override
+    public void configure() {
+
+        
+        onException(java.lang.Exception.class)
+            .handled(true)
+            .description("None")
+            .log(LoggingLevel.ERROR, "Exception: {{exception.message}}, StackTrace: {{exception.stacktrace}}").id("logBodyRequest")
+            .to(ExchangePattern.InOnly, "direct:CorreoSoporte")
+            .end();
+
+        onException(java.sql.SQLException.class)
+            .handled(true)
+            .maximumRedeliveries(3)
+            .redeliveryDelay(3000)
+            .retryAttemptedLogLevel(LoggingLevel.TRACE)
+            .retriesExhaustedLogLevel(LoggingLevel.TRACE)
+            .log(LoggingLevel.ERROR, "Headers: ${headers}")
+            .log(LoggingLevel.ERROR, "Exception Message: {{exception.message}}")
+            .log(LoggingLevel.ERROR, "Exception Stack: {{exception.stacktrace}}")
+            .setProperty("errorMessage", simple("{{exception.stacktrace}}"))
+            .to(ExchangePattern.InOnly, "direct:CorreoSoporte")
+            .log(LoggingLevel.ERROR, "Response error: {{body}}")
+            .end();
+
+        onException(java.sql.SQLIntegrityConstraintViolationException.class)
+        .log(LoggingLevel.ERROR, "Error insertando el identifier en la base de datos (Dato requerido Null)")
+        .log(LoggingLevel.ERROR, "Exception Message: {{exception.message}}")
+        .to(ExchangePattern.InOnly, "direct:CorreoSoporte")
+        .end();
+
+        restConfiguration()
+            .contextPath("/api/rest")
+            .bindingMode(RestBindingMode.off)
+            .component(servlet)
+            .port(8083)
+            .componentProperty("servletName", "OrderServlet")
+            .dataFormatProperty("prettyPrint", "true");
+
+        rest("/order")
+            .get("/get")
+                .bindingMode(RestBindingMode.json)
+                .produces("application/json")
+                .type(com.demo.GetRequest.class)
+                .to("direct:order")
+            .post("/post")
+                .bindingMode(RestBindingMode.json)
+                .produces("application/json")
+                .type(com.demo.PostRequest.class)
+                .description("Test POST request")
+                .param().endParam().name("body").type(RestParamType.body).description("The user to update or create")
+                .to("direct:updateOrder-close");
+
+        from("{{identifier.queue.from}}")
+            .routeId("ROUTE_BT_route")
+            .log(":::: INICIA LA RUTA route :::::").id("_log1")
+            .choice().id("_choice1") // (source line: 69)
+                .when(simple("{{body}} != ''")).id("_when1")
+                    .setProperty("xmlFromQueue", simple("{{body}}"))
+                    .log("Mensaje de AMQ: \n ${exchangeProperty.xmlFromQueue}").id("_log2")
+                    .setHeader("identifier", xpath("//example", java.lang.String.class))
+                    .log("identifier para realizar la consulta: ${headers.identifier}").id("_log3")
+                    .unmarshal()
+                    .description("UnMarshalling").jaxb("com.avianca.route.rest.dto")
+                    .setHeader("unmarshall", simple("{{body}}"))
+                    .log("Consulta a realizar: \n {{sql.query.route.select}} con identifier = ${headers.identifier}").id("_log4")
+                    .to("sql:{{sql.query.route.select}}").id("_to1")
+                    .choice().id("_choice2") // (source line: 93)
+                        .when(simple("${bodyAs(String)} != '[]'")).id("_when2")
+                            .setProperty("bodySql", simple("${body[0]}"))
+                            .setBody(simple("${headers.unmarshall}"))
+                            .log("Procesamiento para la data recibida").id("_log5")
+                            .process(mappingSqlProcessor).id("_process1")
+                            .log("Headers query: ${headers.queryUpdate} ").id("_log6")
+                            .log("++ ${headers.identifier} ++").id("_log7")
+                            .to("jdbc://dsroute").id("_to2")
+                            .log("Update count es ${headers.CamelJdbcUpdateCount}").id("_log8")
+                            .log("Se realizó el Update Exitosamente").id("_log9")
+                            .setHeader("legDetLog", simple("${exchangeProperty.xmlFromQueue}", String.class))
+                            .to("sql:{{sql.query.route.insert}}").id("_to3")
+                            .log("Se realizó el Insert en Exitosamente").id("_log10")
+                        .endChoice() // (source line: 94)
+                        .otherwise().id("_otherwise1")
+                            .description("Insert Nuevo registro en BD")
+                            .setBody(simple("${headers.unmarshall}"))
+                            .log("No existe data en BD se realizara Insert").id("_log11")
+                            .log("Inicia proceso para inserción").id("_log12")
+                            .process(mappingProcessor).id("_process3")
+                            .log("Insert BD: \n {{sql.query.route.insert}}").id("_log13")
+                            .to("sql:{{sql.query.route.insert}}").id("_to4")
+                            .log("Se realizó el Insert Exitosamente").id("_log14")
+                            .setHeader("legDetLog", simple("${exchangeProperty.xmlFromQueue}", String.class))
+                            .to("sql:{{sql.query.route.insert.legdet}}").id("_to5")
+                            .log("Se realizó el Insert en Exitosamente").id("_log15")
+                        .endChoice() // (source line: 121)
+                    .end() // end choice (source line: 93)
+                .endChoice() // (source line: 70)
+                .otherwise().id("_otherwise2")
+                    .log(LoggingLevel.ERROR, "No existe mensaje de entrada").id("_log16")
+                .endChoice() // (source line: 145)
+            .end() // end choice (source line: 69)
+            .log(":::::RUTA route FINALIZADA EXITOSAMENTE::::").id("_log17")
+            .end();
+
+        from("direct:CorreoSoporte")
+            .routeId("MailNotification")
+            .log(LoggingLevel.DEBUG, "Notificando el Error => ${exchangeProperty.errorMessage}").id("_log18")
+            .setHeader("DescripcionError", simple("${exchangeProperty.errorMessage}"))
+            .setHeader("NombreServicio", simple("{{application.service.name}}"))
+            .setHeader("TipoServicio", simple("{{application.service.type}}"))
+            .setProperty("mailTo", simple("{{email.to}}"))
+            .setProperty("mailFrom", simple("{{email.from}}"))
+            .setProperty("mailSubject", simple("{{email.subject}}"))
+            .setProperty("mailTemplate", constant("{{email.template.send.notification}}"))
+            .process(prepareMailingNotificationProcessor).id("_process2")
+            .log(LoggingLevel.WARN, "Enviando mensaje a la JMS de Notificaciones: {{body}}").id("_log35")
+            .inOnly("{{mail.notification.queue.name}}")
+            .end();
+
+        from("direct:do-try-test")
+            .routeId("direct:do-try-test")
+            .doTry()
+                .doTry()
+                    .throwException(java.lang.IllegalArgumentException.class, "Forced").id("throwException1")
+                    .doCatch().id("doCatch1")
+                        .log("doCatch 1").id("log1")
+                        .throwException(java.lang.IllegalArgumentException.class, "Forced").id("throwException2")
+                .endDoTry() // (source line: 188)
+                .doCatch().id("doCatch2")
+                    .log("doCatch 2").id("log2")
+                .doCatch().onWhen(simple("{{exception.message}} contains 'foo'"))
+                    .log("doCatch 3").id("log2")
+                    .log("doFinally").id("log2")
+            .endDoTry() // (source line: 187)
+            .end();
+
+    }
+}
+    
\ No newline at end of file
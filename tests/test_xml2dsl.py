@@ -1,11 +1,1077 @@
+import collections
+import gzip
+import io
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
-from xml2dsl.xml2dsl import xml_to_dsl
-from unittest import TestCase, mock
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from lxml import etree
+
+from xml2dsl import imports
+from xml2dsl.xml2dsl import console, Converter, ImportCycleError, UnresolvedReferenceError, UnsupportedElementError, \
+    build_arg_parser, parse_document, register_handler, unregister_handler, rewrite_expression
+from xml2dsl.batch import convert_file, run_batch
+from xml2dsl.server import handle_stream
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CAMEL_CONTEXT = os.path.join(TESTS_DIR, 'camel-context.xml')
+EXPECTED_DSL = os.path.join(TESTS_DIR, 'camel-context.java')
+CAMEL_NS = 'http://camel.apache.org/schema/spring'
+
+
+def temporary_directory(test):
+    """Directory removed once test is done."""
+    tmp = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, tmp)
+    return tmp
+
 
 class TestScript(unittest.TestCase):
 
-    def test_upper(self):
-        self.assertEqual(xml_to_dsl(), 0)
+    def test_convert(self):
+        with open(EXPECTED_DSL, "r") as expected:
+            self.assertEqual(Converter().convert(CAMEL_CONTEXT), expected.read())
+
+    def test_convert_to_stream(self):
+        output = io.StringIO()
+        self.assertIsNone(Converter().convert(CAMEL_CONTEXT, output))
+        with open(EXPECTED_DSL, "r") as expected:
+            self.assertEqual(output.getvalue(), expected.read())
+
+    def test_log_levels(self):
+        for args, calls in ((['--quiet'], 0), ([], 2)):
+            with mock.patch.object(console, 'log') as log:
+                Converter(build_arg_parser().parse_args(args)).convert(CAMEL_CONTEXT)
+            self.assertEqual(log.call_count, calls)
+
+        with mock.patch.object(console, 'log') as log:
+            Converter(build_arg_parser().parse_args(['--verbose'])).convert(CAMEL_CONTEXT)
+        self.assertIn(mock.call("processing node", f'{{{CAMEL_NS}}}route', 66), log.call_args_list)
+
+    def test_convert_streaming(self):
+        options = build_arg_parser().parse_args(['--stream'])
+        with open(EXPECTED_DSL, "r") as expected:
+            self.assertEqual(Converter(options).convert(CAMEL_CONTEXT), expected.read())
+
+
+class TestInputs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = temporary_directory(self)
+        with open(EXPECTED_DSL, "r") as expected:
+            self.expected = expected.read()
+        with open(CAMEL_CONTEXT, "rb") as xml:
+            self.xml = xml.read()
+
+    def assertConverts(self, source):
+        for args in ([], ['--stream']):
+            self.assertEqual(Converter(build_arg_parser().parse_args(args)).convert(source), self.expected)
+
+    def test_bytes(self):
+        self.assertConverts(self.xml)
+
+    def test_archive_entry(self):
+        war = os.path.join(self.tmp, 'app.war')
+        with zipfile.ZipFile(war, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('WEB-INF/classes/camel-context.xml', self.xml)
+        self.assertConverts(war + '!/WEB-INF/classes/camel-context.xml')
+
+    def test_gzip(self):
+        path = os.path.join(self.tmp, 'camel-context.xml.gz')
+        with gzip.open(path, 'wb') as compressed:
+            compressed.write(self.xml)
+        self.assertConverts(path)
+
+    def test_memory_map(self):
+        with mock.patch('xml2dsl.xml2dsl.MMAP_THRESHOLD', 0):
+            self.assertConverts(CAMEL_CONTEXT)
+
+
+class TestIndex(unittest.TestCase):
+    FORWARD_REFERENCE = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="forward" xmlns="http://camel.apache.org/schema/spring">
+        <route id="r1">
+            <from uri="direct:start"/>
+            <to uri="ref:target"/>
+        </route>
+        <endpoint id="target" uri="seda:target"/>
+    </camelContext>
+</beans>'''
+
+    def test_forward_endpoint_reference(self):
+        for args in ([], ['--stream']):
+            converter = Converter(build_arg_parser().parse_args(args))
+            java = converter.convert(io.BytesIO(self.FORWARD_REFERENCE.encode()))
+            self.assertIn('.to("seda:target")', java)
+            self.assertEqual(converter.index.endpoints, {'target': 'seda:target'})
+            self.assertEqual(converter.index.route_ids, {'r1': 3})
+            self.assertEqual(converter.index.contexts, ['forward'])
+
+    def test_incomplete_endpoints(self):
+        xml = self.FORWARD_REFERENCE.replace('<endpoint id="target" uri="seda:target"/>', '''
+        <endpoint id="target" uri="seda:target"/>
+        <endpoint uri="seda:anonymous"/>
+        <endpoint id="nowhere"/>''')
+        tmp = temporary_directory(self)
+        converter = Converter(build_arg_parser().parse_args(['--cache-dir', tmp]))
+        self.assertIn('.to("seda:target")', converter.convert(io.BytesIO(xml.encode())))
+        self.assertEqual(converter.index.endpoints, {'target': 'seda:target'})
+
+    def test_tables(self):
+        for args in ([], ['--stream']):
+            converter = Converter(build_arg_parser().parse_args(args))
+            converter.convert(CAMEL_CONTEXT)
+            index = converter.index
+            self.assertEqual(index.route_ids, {'ROUTE_BT_route': 66, 'MailNotification': 153})
+            self.assertEqual(index.endpoints, {'rsServerEndpoint': 'cxfrs://bean://restServer'})
+            self.assertEqual(index.contexts, ['ctx-BT_route'])
+
+
+class TestOutputDirectory(unittest.TestCase):
+    CONTEXTS = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="orders-api" xmlns="http://camel.apache.org/schema/spring">
+        <route id="orders">
+            <from uri="direct:orders"/>
+            <setBody><groovy>request.body.orders</groovy></setBody>
+        </route>
+    </camelContext>
+    <camelContext xmlns="http://camel.apache.org/schema/spring">
+        <route id="billing">
+            <from uri="direct:billing"/>
+            <setBody><groovy>request.body.billing</groovy></setBody>
+        </route>
+    </camelContext>
+</beans>'''
+
+    def test_one_class_per_context(self):
+        tmp = temporary_directory(self)
+        package_dir = os.path.join(tmp, 'com', 'example', 'routes')
+        for args in ([], ['--stream'], ['--jobs', '2']):
+            options = build_arg_parser().parse_args(['--package', 'com.example.routes'] + args)
+            paths = Converter(options).convert_to_directory(io.BytesIO(self.CONTEXTS.encode()), tmp)
+            self.assertEqual(paths, [os.path.join(package_dir, 'OrdersApi.java'),
+                                     os.path.join(package_dir, 'CamelContext1.java')])
+
+            with open(paths[0], "r") as orders:
+                orders = orders.read()
+            self.assertIn('package com.example.routes;', orders)
+            self.assertIn('public class OrdersApi extends RouteBuilder', orders)
+            self.assertIn('from("direct:orders")', orders)
+            self.assertIn('String groovy_0 =', orders)
+            self.assertNotIn('billing', orders)
+
+            with open(paths[1], "r") as billing:
+                billing = billing.read()
+            self.assertIn('from("direct:billing")', billing)
+            self.assertIn('.setBody().groovy(groovy_1)', billing)
+            self.assertNotIn('groovy_0', billing)
+        self.assertEqual(sorted(os.listdir(package_dir)), ['CamelContext1.java', 'OrdersApi.java'])
+
+    SHARDED = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <bean id="orderProcessor" class="com.example.OrderProcessor"/>
+    <bean id="auditProcessor" class="com.example.AuditProcessor"/>
+    <camelContext id="orders-api" xmlns="http://camel.apache.org/schema/spring">
+        <dataFormats><json id="orderJson" library="Jackson"/></dataFormats>
+        <onException>
+            <exception>java.lang.Exception</exception>
+            <handled><constant>true</constant></handled>
+            <to uri="direct:errors"/>
+        </onException>
+        <route id="orders">
+            <from uri="direct:orders"/>
+            LOG
+            <process ref="orderProcessor"/>
+        </route>
+        <route id="returns">
+            <from uri="direct:returns"/>
+            LOG
+            <marshal ref="orderJson"/>
+        </route>
+        <route id="audit">
+            <from uri="direct:audit"/>
+            LOG
+            <setBody><groovy>request.body.audit</groovy></setBody>
+            <process ref="auditProcessor"/>
+        </route>
+    </camelContext>
+</beans>'''.replace('LOG', f'<log message="{"x" * 400}"/>')
+
+    def test_shards(self):
+        tmp = temporary_directory(self)
+        [unsharded] = Converter().convert_to_directory(io.BytesIO(self.SHARDED.encode()), tmp)
+        with open(unsharded, "r") as unsharded:
+            unsharded = unsharded.read()
+        for args in (['--shard-routes', '2'], ['--shard-routes', '2', '--stream'],
+                     ['--shard-size', '1', '--jobs', '2']):
+            shutil.rmtree(os.path.join(tmp, 'xml2dsl'))
+            paths = Converter(build_arg_parser().parse_args(args)).convert_to_directory(
+                io.BytesIO(self.SHARDED.encode()), tmp)
+            shards = []
+            for path in paths:
+                with open(path, "r") as shard:
+                    shards.append(shard.read())
+            self.assertEqual(len(shards), 2 if args[0] == '--shard-routes' else 3)
+            self.assertIn('public class OrdersApiPart1 extends RouteBuilder', shards[0])
+            for shard in shards:
+                self.assertEqual(shard.count('onException(java.lang.Exception.class)'), 1)
+                self.assertEqual(shard.count('JsonDataFormat orderJson'), 1)
+            self.assertIn('OrderProcessor orderProcessor;', shards[0])
+            self.assertNotIn('AuditProcessor', shards[0])
+            self.assertNotIn('String groovy_0 =', shards[0])
+            self.assertNotIn('OrderProcessor', shards[-1])
+            self.assertIn('AuditProcessor auditProcessor;', shards[-1])
+            self.assertIn('String groovy_0 =', shards[-1])
+            routes = ''.join(shard[shard.index('        from('):shard.rindex('    }\n}')] for shard in shards)
+            self.assertEqual(routes, unsharded[unsharded.index('        from('):unsharded.rindex('    }\n}')])
+
+        [single] = Converter(build_arg_parser().parse_args(['--shard-routes', '3'])).convert_to_directory(
+            io.BytesIO(self.SHARDED.encode()), tmp)
+        with open(single, "r") as single:
+            self.assertEqual(single.read(), unsharded)
+        with self.assertRaises(ValueError):
+            Converter(build_arg_parser().parse_args(['--shard-routes', '2'])).convert(CAMEL_CONTEXT)
+
+
+class TestGroovyResources(unittest.TestCase):
+    GROOVY = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="scripts" xmlns="http://camel.apache.org/schema/spring">
+        <route id="r1">
+            <from uri="direct:start"/>
+            <setBody><groovy>"hello " + request.body</groovy></setBody>
+            <setHeader name="h"><groovy>"hello " + request.body</groovy></setHeader>
+        </route>
+    </camelContext>
+</beans>'''
+
+    def test_scripts_are_written_once_by_content(self):
+        tmp = temporary_directory(self)
+        options = build_arg_parser().parse_args(['--groovy-resources', tmp])
+        outputs = [Converter(options).convert(io.BytesIO(self.GROOVY.encode())) for _ in range(2)]
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertNotIn('String groovy_', outputs[0])
+
+        scripts = os.listdir(os.path.join(tmp, 'xml2dsl', 'groovy'))
+        self.assertEqual(len(scripts), 1)
+        self.assertEqual(outputs[0].count(f'groovy("resource:classpath:xml2dsl/groovy/{scripts[0]}")'), 2)
+        with open(os.path.join(tmp, 'xml2dsl', 'groovy', scripts[0]), "r") as script:
+            self.assertEqual(script.read(), '"hello " + request.body')
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_jobs_keep_document_order(self):
+        with open(EXPECTED_DSL, "r") as expected:
+            expected = expected.read()
+        for args in (['--jobs', '2'], ['--jobs', '2', '--stream']):
+            self.assertEqual(Converter(build_arg_parser().parse_args(args)).convert(CAMEL_CONTEXT), expected)
+
+    def test_worker_errors_keep_source_lines(self):
+        with open(CAMEL_CONTEXT, "rb") as xml:
+            unknown = xml.read().replace(b'<inOnly', b'<unknown')
+        with self.assertRaises(UnsupportedElementError) as error:
+            Converter(build_arg_parser().parse_args(['--jobs', '2'])).convert(io.BytesIO(unknown))
+        self.assertEqual(error.exception.sourceline, 183)
+
+    def test_translation_leaves_the_tree_untouched(self):
+        converter = Converter()
+        converter.convert(CAMEL_CONTEXT)
+        with open(CAMEL_CONTEXT, "rb") as xml:
+            route = etree.parse(xml).getroot().find('.//{%s}route' % CAMEL_NS)
+        before = etree.tostring(route)
+        first = converter.translate_detached(route, 2)
+        self.assertEqual(etree.tostring(route), before)
+        self.assertEqual(converter.translate_detached(route, 2), first)
+        self.assertEqual(first[1], 0)
+
+
+class TestTargets(unittest.TestCase):
+
+    def test_java_and_yaml_from_one_parse(self):
+        tmp = temporary_directory(self)
+        java_only = os.path.join(tmp, 'java-only')
+        [java_path] = Converter().convert_to_directory(CAMEL_CONTEXT, java_only)
+        with open(java_path, "r") as expected:
+            expected = expected.read()
+        for args in ([], ['--stream'], ['--jobs', '2']):
+            options = build_arg_parser().parse_args(['--target', 'java,yaml'] + args)
+            paths = Converter(options).convert_to_directory(CAMEL_CONTEXT, tmp)
+            self.assertEqual(paths, [os.path.join(tmp, 'xml2dsl', 'CtxBTRoute.java'),
+                                     os.path.join(tmp, 'CtxBTRoute.camel.yaml')])
+            with open(paths[0], "r") as java:
+                self.assertEqual(java.read(), expected)
+
+            with open(paths[1], "r") as yaml_dsl:
+                yaml_dsl = yaml_dsl.read()
+            self.assertIn('- route:\n', yaml_dsl)
+            self.assertIn('      uri: "direct:CorreoSoporte"\n', yaml_dsl)
+            self.assertIn('# TODO endpoint (source line: 16)', yaml_dsl)
+        try:
+            import yaml
+        except ImportError:
+            return
+        routes = [item['route'] for item in yaml.safe_load(yaml_dsl) if 'route' in item]
+        self.assertEqual([route.get('id') for route in routes], ['ROUTE_BT_route', 'MailNotification', None])
+
+    def test_yaml_keys(self):
+        try:
+            import yaml
+        except ImportError:
+            self.skipTest('pyyaml is not installed')
+        converter = Converter(build_arg_parser().parse_args(['--target', 'yaml']))
+        stack = yaml.safe_load(converter.convert(CAMEL_CONTEXT))
+        keys = collections.Counter()
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                keys.update(value.keys())
+                self.assertNotEqual(value.get('description'), {})
+                stack.extend(value.values())
+            elif isinstance(value, list):
+                stack.extend(value)
+        for camel2 in ('headerName', 'propertyName', 'loggerRef'):
+            self.assertNotIn(camel2, keys)
+        self.assertEqual(keys['logger'], 26)
+
+    def test_ir_translation(self):
+        from xml2dsl import ir
+        with open(CAMEL_CONTEXT, "rb") as xml:
+            route = etree.parse(xml).getroot().find('.//{%s}route' % CAMEL_NS)
+        converter = Converter()
+        converter.convert(CAMEL_CONTEXT)
+        copy = ir.from_lxml(route)
+        self.assertEqual(copy.sourceline, route.sourceline)
+        self.assertEqual(converter.translate_detached(copy, 2), converter.translate_detached(route, 2))
+        self.assertEqual(pickle.loads(pickle.dumps(copy)).canonical(), copy.canonical())
+
+    def test_several_targets_need_a_directory(self):
+        options = build_arg_parser().parse_args(['--target', 'java,yaml'])
+        with self.assertRaises(ValueError):
+            Converter(options).convert(CAMEL_CONTEXT)
+
+
+class TestNesting(unittest.TestCase):
+    DEPTH = sys.getrecursionlimit() + 200
+
+    def test_deeper_than_the_recursion_limit(self):
+        tmp = temporary_directory(self)
+        xml = os.path.join(tmp, 'deep.xml')
+        with open(xml, 'w') as xml_file:
+            xml_file.write('<beans xmlns="http://www.springframework.org/schema/beans">'
+                           f'<camelContext id="deep" xmlns="{CAMEL_NS}"><route><from uri="direct:deep"/>'
+                           + '<split><tokenize token=","/>' * self.DEPTH + '<to uri="mock:leaf"/>'
+                           + '</split>' * self.DEPTH + '</route></camelContext></beans>')
+        for args in ([], ['--stream'], ['--profile', os.path.join(tmp, 'profile.json')]):
+            options = build_arg_parser().parse_args(['--target', 'java,yaml'] + args)
+            java, yaml_dsl = Converter(options).convert_to_directory(xml, tmp)
+            with open(java, "r") as java:
+                java = java.read()
+            self.assertEqual(java.count('.end() // end split'), self.DEPTH)
+            self.assertIn('\n' + ' ' * 4 * (self.DEPTH + 3) + '.to("mock:leaf")', java)
+            with open(yaml_dsl, "r") as yaml_dsl:
+                self.assertEqual(yaml_dsl.read().count('- split:'), self.DEPTH)
+
+
+class TestRewriter(unittest.TestCase):
+
+    def test_rewrite_expression(self):
+        self.assertEqual(rewrite_expression('${property.a.b} ${header.foo} ${header.x} ${body} ${headers}\n"q"'),
+                         "${exchangeProperty.a.b} ${headers.foo} {{header.x}} {{body}} ${headers}'q'")
+        self.assertEqual(rewrite_expression('sql:{{query}}?p=${exchangeProperty.id}'),
+                         'sql:{{query}}?p=${exchangeProperty.id}')
+
+    def test_rewrite_cache(self):
+        rewrite_expression.cache_clear()
+        for _ in range(3):
+            rewrite_expression('direct:${header.target}')
+        info = rewrite_expression.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+
+
+class TestMemo(unittest.TestCase):
+    CHOICE = '''<choice>
+                <when>
+                    <simple>${header.type} == 'a'</simple>
+                    <bean ref="handler" method="handle"/>
+                </when>
+                <otherwise>
+                    <log message="100% other"/>
+                </otherwise>
+            </choice>'''
+    XML = f'''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="memo" xmlns="http://camel.apache.org/schema/spring">
+        <route id="r1">
+            <from uri="direct:r1"/>
+            {CHOICE}
+        </route>
+        <route id="r2">
+            <from uri="direct:r2"/>
+            <split>
+                <tokenize token=","/>
+                {CHOICE}
+            </split>
+        </route>
+        <route id="r3">
+            <from uri="direct:r3"/>
+            {CHOICE.replace("'a'", "'b'")}
+        </route>
+        <route id="r4">
+            <from uri="direct:r4"/>
+            {CHOICE}
+        </route>
+    </camelContext>
+</beans>'''
+
+    def test_repeated_fragments_are_reused(self):
+        xml = self.XML.encode()
+        with mock.patch.object(Converter, 'MEMO_TAGS', frozenset()):
+            expected = Converter(build_arg_parser().parse_args(['--keep-going'])).convert(xml)
+            expected_report = Converter(build_arg_parser().parse_args(['--keep-going']))
+            expected_report.convert(xml)
+        self.assertIn('.end() // end choice (source line: 19)', expected)
+        self.assertIn('.log("100% other")', expected)
+
+        for args in ([], ['--stream', '--jobs', '2']):
+            converter = Converter(build_arg_parser().parse_args(['--keep-going'] + args))
+            self.assertEqual(converter.convert(xml), expected)
+            self.assertEqual((converter.memo_hits, converter.memo_misses), (1, 3))
+            self.assertEqual(converter.report(), expected_report.report())
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = temporary_directory(self)
+        self.options = build_arg_parser().parse_args(['--cache-dir', os.path.join(self.tmp, 'cache')])
+
+    def test_unchanged_routes_come_from_cache(self):
+        with open(EXPECTED_DSL, "r") as expected:
+            expected = expected.read()
+        first = Converter(self.options)
+        self.assertEqual(first.convert(CAMEL_CONTEXT), expected)
+        self.assertEqual((first.cache.hits, first.cache.misses), (0, 6))
+
+        second = Converter(self.options)
+        self.assertEqual(second.convert(CAMEL_CONTEXT), expected)
+        self.assertEqual((second.cache.hits, second.cache.misses), (6, 0))
+
+    def test_shifted_routes_keep_their_source_lines(self):
+        Converter(self.options).convert(CAMEL_CONTEXT)
+        shifted = os.path.join(self.tmp, 'shifted.xml')
+        with open(CAMEL_CONTEXT, "r") as original, open(shifted, "w") as output:
+            output.write(original.read().replace('<route id="ROUTE_BT_route"', '\n\n<route id="ROUTE_BT_route"'))
+
+        converter = Converter(self.options)
+        self.assertEqual(converter.convert(shifted), Converter().convert(shifted))
+        self.assertEqual(converter.cache.misses, 0)
+
+    def test_overwritten_entries_are_not_counted_twice(self):
+        from xml2dsl.cache import TranslationCache
+        cache = TranslationCache(os.path.join(self.tmp, 'sized'), 1000, '')
+        cache.put('aa', 'first', 2)
+        entry_size = cache.size
+        cache.put('bb', 'second', 2)
+        for _ in range(100):
+            cache.put('bb', 'second', 2)
+        self.assertEqual(cache.size, sum(size for _, _, size in cache.entries()))
+        self.assertEqual(cache.get('aa'), ('first', 2, []))
+        self.assertLess(cache.size, 3 * entry_size)
+
+    def test_concurrent_stores(self):
+        from xml2dsl.cache import TranslationCache
+        cache = TranslationCache(os.path.join(self.tmp, 'shared'), 1 << 20, '')
+
+        def store(thread):
+            for i in range(100):
+                cache.put(f'k{i % 5}', f'{thread}-{i}', 2)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(store, range(4)))
+        self.assertTrue(all(cache.get(f'k{i}') for i in range(5)))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(cache.path('k0')))), ['k0.json'])
+
+    def test_no_cache(self):
+        self.options.no_cache = True
+        self.assertIsNone(Converter(self.options).cache)
+
+
+class TestHandlers(unittest.TestCase):
+    XML = b'''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="custom" xmlns="http://camel.apache.org/schema/spring">
+        <route id="r1">
+            <from uri="direct:start"/>
+            <audit level="high"/>
+        </route>
+    </camelContext>
+</beans>'''
+
+    def test_unknown_element(self):
+        with self.assertRaises(UnsupportedElementError) as error:
+            Converter().convert(self.XML)
+        self.assertEqual(error.exception.sourceline, 5)
+
+    def test_register_handler(self):
+        @register_handler('audit')
+        def audit_def(converter, node):
+            return converter.indent(f'.to("audit:{node.attrib["level"]}")')
+        self.addCleanup(unregister_handler, 'audit')
+
+        self.assertIn('.to("audit:high")', Converter().convert(self.XML))
+
+
+class TestOptimize(unittest.TestCase):
+    XML = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="optimize" xmlns="http://camel.apache.org/schema/spring">
+        <route id="r1">
+            <from uri="direct:start"/>
+            <toD uri="http://backend/{{api.path}}"/>
+            <toD uri="http://backend/${header.path}"/>
+            <toD uri="http4://backend/$simple{header.id}"/>
+            <toD uri="language:xpath:/order/@uri"/>
+            <setHeader name="copy">
+                <simple>${header.source}</simple>
+            </setHeader>
+            <choice>
+                <when>
+                    <simple>${property.flag}</simple>
+                    <to uri="velocity:a.vm?encoding=UTF-8"/>
+                </when>
+            </choice>
+            <split>
+                <tokenize token=","/>
+                <to uri="direct:item"/>
+            </split>
+        </route>
+    </camelContext>
+</beans>'''
+
+    def test_rewrites(self):
+        for args in ([], ['--stream', '--jobs', '2']):
+            converter = Converter(build_arg_parser().parse_args(['--optimize'] + args))
+            java = converter.convert(self.XML.encode())
+            self.assertIn('.to("http://backend/{{api.path}}")', java)
+            self.assertIn('.toD("http://backend/${headers.path}")', java)
+            self.assertIn('.toD("http4://backend/$simple{header.id}")', java)
+            self.assertIn('.toD("language:xpath:/order/@uri")', java)
+            self.assertIn('.setHeader("copy", header("source"))', java)
+            self.assertIn('.when(exchangeProperty("flag"))', java)
+            self.assertIn('.split(tokenize(",")).streaming()', java)
+            self.assertEqual([(d['tag'], d['line']) for d in converter.diagnostics],
+                             [('toD', 5), ('simple', 10), ('simple', 14), ('split', 18)])
+            self.assertEqual(converter.report()['warnings'], 0)
+
+    def test_split_size_keeps_the_split_loaded(self):
+        # read in the split itself or in a route it calls
+        for reader in ('<log message="part ${exchangeProperty.CamelSplitSize}"/><to uri="direct:item"/>',
+                       '<to uri="direct:item"/></split></route><route id="item"><from uri="direct:item"/>'
+                       '<choice><when><simple>${exchangeProperty.CamelSplitSize} > 1</simple>'
+                       '<to uri="log:out"/></when></choice><split><tokenize token=";"/><to uri="log:part"/>'):
+            xml = self.XML.replace('<to uri="direct:item"/>', reader).encode()
+            for args in ([], ['--stream'], ['--stream', '--jobs', '2']):
+                java = Converter(build_arg_parser().parse_args(['--optimize'] + args)).convert(xml)
+                self.assertIn('.split(tokenize(","))\n', java)
+                self.assertNotIn('.streaming()', java)
+
+    def test_opt_in(self):
+        java = Converter().convert(self.XML.encode())
+        self.assertIn('.toD("http://backend/{{api.path}}")', java)
+        self.assertIn('simple("${headers.source}")', java)
+        self.assertIn('.split(tokenize(","))\n', java)
+        self.assertIn('.to("velocity:a.vm?encoding=UTF-8&contentCache=true")', java)
+
+
+class TestExecutorServices(unittest.TestCase):
+    XML = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="pools" xmlns="http://camel.apache.org/schema/spring">
+        <threadPoolProfile id="bigPool" poolSize="20" maxPoolSize="50" keepAliveTime="30" timeUnit="SECONDS"/>
+        <threadPool id="shared" poolSize="4" maxPoolSize="8" threadName="worker"/>
+        <route id="r1">
+            <from uri="direct:start"/>
+            <threads executorServiceRef="shared">
+                <to uri="direct:a"/>
+            </threads>
+            <split parallelProcessing="true" executorServiceRef="shared">
+                <tokenize token=","/>
+                <to uri="direct:b"/>
+            </split>
+            <multicast parallelProcessing="true" executorServiceRef="bigPool">
+                <to uri="direct:c"/>
+            </multicast>
+            <wireTap uri="direct:tap" executorServiceRef="{}"/>
+        </route>
+    </camelContext>
+</beans>'''
+
+    def convert(self, ref, *args):
+        return Converter(build_arg_parser().parse_args(list(args))).convert(self.XML.replace('{}', ref).encode())
+
+    def test_shared_executor_services(self):
+        java = self.convert('shared')
+        self.assertIn('getContext().getExecutorServiceManager().registerThreadPoolProfile(\n'
+                      '            new org.apache.camel.builder.ThreadPoolProfileBuilder("bigPool")\n'
+                      '                .poolSize(20)\n'
+                      '                .maxPoolSize(50)\n'
+                      '                .keepAliveTime(30L, java.util.concurrent.TimeUnit.SECONDS)\n'
+                      '                .build());', java)
+        self.assertIn('getContext().getRegistry().bind("shared",', java)
+        self.assertIn('.build(this, "worker"));', java)
+        self.assertIn('.threads().executorServiceRef("shared")', java)
+        self.assertIn('.split(tokenize(",")).parallelProcessing().executorServiceRef("shared")', java)
+        self.assertIn('.multicast().parallelProcessing().executorServiceRef("bigPool")', java)
+        self.assertIn('.wireTap("direct:tap").executorServiceRef("shared")', java)
+
+    def test_unresolved_executor_service(self):
+        self.assertIn('.executorServiceRef("defaultThreadPoolProfile")\n', self.convert('defaultThreadPoolProfile'))
+        with self.assertRaises(UnresolvedReferenceError):
+            self.convert('missing')
+        self.assertIn('.executorServiceRef("missing") // TODO unresolved reference missing',
+                      self.convert('missing', '--keep-going'))
+
+
+class TestDiagnostics(unittest.TestCase):
+    PROBLEMS = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="problems" xmlns="http://camel.apache.org/schema/spring">
+        <route id="r1">
+            <from uri="direct:start"/>
+            <audit level="high"/>
+            <to uri="ref:missing"/>
+            <bean ref="nobody" method="run"/>
+            <setHeader headerName="h"><simple>${header.name}</simple></setHeader>
+        </route>
+    </camelContext>
+</beans>'''
+
+    def test_stops_on_unresolved_reference(self):
+        xml = self.PROBLEMS.replace('<audit level="high"/>', '')
+        with self.assertRaises(UnresolvedReferenceError) as error:
+            Converter().convert(io.BytesIO(xml.encode()))
+        self.assertEqual((error.exception.detail, error.exception.sourceline), ('missing', 6))
+
+    def test_keep_going(self):
+        tmp = temporary_directory(self)
+        for args in ([], ['--stream'], ['--jobs', '2'], ['--cache-dir', tmp], ['--cache-dir', tmp]):
+            converter = Converter(build_arg_parser().parse_args(['--keep-going'] + args))
+            java = converter.convert(io.BytesIO(self.PROBLEMS.encode()))
+            self.assertIn('// TODO unsupported audit (source line 5)', java)
+            self.assertIn('.to("ref:missing") // TODO unresolved reference missing (source line 6)', java)
+            self.assertIn('.bean("nobody", "run") // TODO unresolved reference nobody (source line 7)', java)
+
+            report = converter.report()
+            self.assertEqual((report['errors'], report['warnings']), (3, 2))
+            self.assertEqual(report['counts'], {'unsupported': {'audit': 1}, 'missing-ref': {'to': 1, 'bean': 1},
+                                                'deprecated': {'setHeader': 1, 'simple': 1}})
+            self.assertEqual([diagnostic['line'] for diagnostic in report['diagnostics']], [5, 6, 7, 8, 8])
+
+    def test_check(self):
+        converter = Converter(build_arg_parser().parse_args(['--check']))
+        report = converter.check(io.BytesIO(self.PROBLEMS.encode()))
+        self.assertEqual(report['errors'], 3)
+        self.assertEqual(converter.out.getvalue(), '')
+        self.assertEqual(Converter(build_arg_parser().parse_args(['--check'])).check(CAMEL_CONTEXT)['errors'], 0)
+
+
+    def test_failing_handlers(self):
+        xml = self.PROBLEMS.replace('<audit level="high"/>', '<bean ref="nobody"/><removeHeader/>')
+        report = Converter(build_arg_parser().parse_args(['--check'])).check(io.BytesIO(xml.encode()))
+        self.assertEqual(report['counts'], {'invalid': {'removeHeader': 1}, 'missing-ref': {'to': 1, 'bean': 2},
+                                            'deprecated': {'setHeader': 1, 'simple': 1}})
+        self.assertEqual(report['diagnostics'][1], {'level': 'error', 'kind': 'invalid', 'tag': 'removeHeader',
+                                                    'line': 5, 'message': "KeyError: 'headerName'"})
+
+        java = Converter(build_arg_parser().parse_args(['--keep-going'])).convert(io.BytesIO(xml.encode()))
+        self.assertIn('.bean("nobody") // TODO unresolved reference nobody (source line 5)', java)
+        self.assertIn('// TODO invalid removeHeader (source line 5): KeyError: \'headerName\'', java)
+
+
+class TestImports(unittest.TestCase):
+    BEANS = '<beans xmlns="http://www.springframework.org/schema/beans">{}</beans>'
+    CONTEXT = BEANS.format('''
+        {}
+        <camelContext id="imports" xmlns="http://camel.apache.org/schema/spring">
+            <route id="r1">
+                <from uri="direct:start"/>
+                <bean ref="common" method="run"/>
+            </route>
+        </camelContext>''')
+    PLAIN = '''<camelContext id="plain" xmlns="http://camel.apache.org/schema/spring">
+            <route id="r1"><from uri="direct:start"/><to uri="log:out"/></route>
+        </camelContext>'''
+
+    def setUp(self):
+        self.tmp = temporary_directory(self)
+        self.addCleanup(imports.clear)
+        imports.clear()
+        os.makedirs(os.path.join(self.tmp, 'resources', 'spring'))
+        self.write('resources/spring/common-beans.xml',
+                   self.BEANS.format('<bean id="common" class="com.example.Common"/>'))
+
+    def write(self, name, xml):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as xml_file:
+            xml_file.write(xml)
+        return path
+
+    def convert(self, resource, *args):
+        path = self.write('context.xml', self.CONTEXT.replace('{}', f'<import resource="{resource}"/>'))
+        converter = Converter(build_arg_parser().parse_args(
+            ['--classpath', os.path.join(self.tmp, 'resources')] + list(args)))
+        return converter, converter.convert(path)
+
+    def test_imported_beans(self):
+        for resource in ('resources/spring/common-beans.xml', 'classpath:spring/common-beans.xml',
+                         'classpath*:/spring/common-beans.xml'):
+            for args in ([], ['--stream'], ['--jobs', '2']):
+                java = self.convert(resource, *args)[1]
+                self.assertIn('.bean(com.example.Common.class, "run")', java)
+
+    def test_documents_are_parsed_once(self):
+        with mock.patch('xml2dsl.imports.parse_document', wraps=imports.parse_document) as parse:
+            self.convert('classpath:spring/common-beans.xml')
+            self.convert('classpath:spring/common-beans.xml')
+        self.assertEqual(parse.call_count, 1)
+
+    def test_missing_and_cyclic_imports(self):
+        # a missing resource only leaves its beans out, the references to them fail on their own
+        with self.assertRaises(UnresolvedReferenceError) as error:
+            self.convert('classpath:spring/missing.xml')
+        self.assertEqual(error.exception.detail, 'common')
+        converter = Converter(build_arg_parser().parse_args([]))
+        java = converter.convert(io.BytesIO(self.BEANS.format(
+            '<import resource="classpath:META-INF/spring/common.xml"/>' + self.PLAIN).encode()))
+        self.assertIn('from("direct:start")', java)
+        self.assertEqual(converter.report()['diagnostics'], [
+            {'level': 'warning', 'kind': 'missing-ref', 'tag': 'import', 'line': 1,
+             'message': 'unresolved import classpath:META-INF/spring/common.xml'}])
+
+        self.write('resources/spring/a.xml', self.BEANS.format('<import resource="b.xml"/>'))
+        self.write('resources/spring/b.xml', self.BEANS.format('<import resource="a.xml"/>'))
+        with self.assertRaises(ImportCycleError):
+            self.convert('resources/spring/a.xml')
+        converter, java = self.convert('resources/spring/a.xml', '--keep-going')
+        self.assertIn('.bean("common", "run") // TODO unresolved reference common', java)
+        self.assertEqual(converter.report()['counts'], {'import-cycle': {'import': 1}, 'missing-ref': {'bean': 1}})
+
+
+class TestGraph(unittest.TestCase):
+    XML = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="graph" xmlns="http://camel.apache.org/schema/spring">
+        <endpoint id="audit" uri="seda:audit"/>
+        <onException>
+            <exception>java.lang.Exception</exception>
+            <to uri="direct:error"/>
+        </onException>
+        <route id="entry">
+            <from uri="timer:tick?period=1000"/>
+            <to uri="direct:validate"/>
+            <recipientList>
+                <constant>direct:a,direct:b</constant>
+            </recipientList>
+            <to uri="direct:missing"/>
+        </route>
+        <route id="validate">
+            <from uri="direct:validate"/>
+            <to uri="ref:audit"/>
+            <to uri="direct:a"/>
+        </route>
+        <route id="a">
+            <from uri="direct:a"/>
+            <toD uri="direct:next-${header.next}"/>
+        </route>
+        <route id="b">
+            <from uri="direct:b"/>
+            <log message="b"/>
+        </route>
+        <route id="audit">
+            <from uri="seda:audit"/>
+            <log message="audit"/>
+        </route>
+        <route id="error">
+            <from uri="direct:error"/>
+            <log message="error"/>
+        </route>
+        <route id="next">
+            <from uri="direct:next-one"/>
+            <log message="next"/>
+        </route>
+        <route id="dead">
+            <from uri="direct:dead"/>
+            <to uri="direct:loop1"/>
+        </route>
+        <route id="loop1">
+            <from uri="direct:loop1"/>
+            <to uri="direct:loop2"/>
+        </route>
+        <route id="loop2">
+            <from uri="direct:loop2"/>
+            <to uri="direct:loop1"/>
+        </route>
+    </camelContext>
+</beans>'''
+
+    def setUp(self):
+        self.tmp = temporary_directory(self)
+
+    def test_report(self):
+        path = os.path.join(self.tmp, 'graph.json')
+        Converter(build_arg_parser().parse_args(['--graph', path])).convert(self.XML.encode())
+        with open(path) as report_file:
+            report = json.load(report_file)
+
+        def names(entries):
+            return [entry['route'] for entry in entries]
+        self.assertEqual(report['routes'], 10)
+        self.assertEqual(names(report['entry_points']), ['entry'])
+        self.assertEqual(names(report['unreachable']), ['dead', 'loop1', 'loop2'])
+        self.assertEqual([names(cycle) for cycle in report['cycles']], [['loop1', 'loop2']])
+        self.assertEqual(report['fan_out'][0], {'route': 'entry', 'line': 8, 'calls': 3})
+        self.assertEqual(names(report['fan_in']), ['a', 'loop1'])
+        self.assertEqual(report['dangling'], [{'route': 'entry', 'endpoint': 'direct:missing', 'line': 14}])
+        self.assertEqual(report['dynamic'], [{'route': 'a', 'uri': 'direct:next-${header.next}', 'line': 23,
+                                              'matches': 1}])
+
+    def test_prune(self):
+        for args in ([], ['--stream'], ['--stream', '--jobs', '2']):
+            java = Converter(build_arg_parser().parse_args(['--prune'] + args)).convert(self.XML.encode())
+            self.assertIn('from("direct:next-one")', java)
+            self.assertIn('from("direct:error")', java)
+            for uri in ('direct:dead', 'direct:loop1', 'direct:loop2'):
+                self.assertNotIn(f'from("{uri}")', java)
+
+    def test_unknown_endpoints_keep_every_route(self):
+        xml = self.XML.replace('<log message="b"/>', '<recipientList><simple>${header.to}</simple></recipientList>')
+        java = Converter(build_arg_parser().parse_args(['--prune'])).convert(xml.encode())
+        self.assertIn('from("direct:dead")', java)
+
+    def test_jvm_endpoints_are_entry_points(self):
+        xml = self.XML.replace('<route id="dead">', '''<route id="orders">
+            <from uri="direct-vm:orders"/>
+            <to uri="vm:shipping"/>
+        </route>
+        <route id="events">
+            <from uri="vm:events"/>
+            <log message="events"/>
+        </route>
+        <route id="dead">''').encode()
+        path = os.path.join(self.tmp, 'graph.json')
+        java = Converter(build_arg_parser().parse_args(['--prune', '--graph', path])).convert(xml)
+        self.assertIn('from("direct-vm:orders")', java)
+        self.assertIn('from("vm:events")', java)
+        with open(path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual([entry['route'] for entry in report['entry_points']], ['entry', 'orders', 'events'])
+        self.assertEqual([entry['endpoint'] for entry in report['dangling']], ['direct:missing'])
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_handler_counters(self):
+        converter = Converter()
+        profiler = converter.enable_profiling()
+        with open(EXPECTED_DSL, "r") as expected:
+            self.assertEqual(converter.convert(CAMEL_CONTEXT), expected.read())
+
+        self.assertEqual(profiler.handlers['route_def'].calls, 3)
+        self.assertEqual(profiler.handlers['log_def'].calls, 30)
+        route = profiler.handlers['route_def']
+        self.assertLessEqual(route.self, route.cumulative)
+        self.assertGreater(sum(stats.output_chars for stats in profiler.handlers.values()), 7000)
+        self.assertEqual(set(profiler.phases()), {'total', 'parse', 'translate', 'memo', 'cache', 'write'})
+        self.assertIn('\nroute_def;choice_def;when_def ', profiler.collapsed())
+
+    def test_reused_translations(self):
+        routes = ''.join(f'''<route id="r{i}"><from uri="direct:r{i}"/><choice>
+            <when><simple>${{header.a}}</simple><to uri="log:a"/></when><otherwise><to uri="log:b"/></otherwise>
+        </choice></route>''' for i in range(20))
+        xml = ('<beans xmlns="http://www.springframework.org/schema/beans"><camelContext id="reused" '
+               f'xmlns="http://camel.apache.org/schema/spring">{routes}</camelContext></beans>').encode()
+        tmp = temporary_directory(self)
+        options = build_arg_parser().parse_args(['--cache-dir', tmp])
+
+        converter = Converter(options)
+        profiler = converter.enable_profiling()
+        converter.convert(io.BytesIO(xml))
+        # the first copy is translated, the others are written from the memo once the second one is recorded
+        self.assertEqual((profiler.handlers['choice_def'].calls, profiler.handlers['memo_hit'].calls), (2, 19))
+        self.assertGreater(profiler.memo, 0)
+
+        converter = Converter(options)
+        profiler = converter.enable_profiling()
+        converter.convert(io.BytesIO(xml))
+        self.assertEqual((profiler.handlers['route_def'].calls, profiler.handlers['cache_hit'].calls), (0, 20))
+        self.assertGreater(profiler.cache, 0)
+        self.assertEqual(profiler.translate, 0)
+
+    def test_profile_files(self):
+        tmp = temporary_directory(self)
+        profile = os.path.join(tmp, 'profile.json')
+        args = build_arg_parser().parse_args(['--xml', CAMEL_CONTEXT, '--output', os.path.join(tmp, 'Routes.java'),
+                                              '--profile', profile, '--jobs', '2'])
+        Converter(args).xml_to_dsl(args)
+        with open(profile, "r") as report:
+            report = json.load(report)
+        self.assertEqual(report['handlers'][0].keys(), {'handler', 'calls', 'cumulative', 'self', 'output_chars'})
+        self.assertIn('from_def', [handler['handler'] for handler in report['handlers']])
+        with open(os.path.join(tmp, 'profile.folded'), "r") as stacks:
+            for line in stacks:
+                self.assertRegex(line, r'^\w+(;\w+)* \d+$')
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = temporary_directory(self)
+        self.xml_dir = os.path.join(self.tmp, 'in')
+        self.output_dir = os.path.join(self.tmp, 'out')
+        os.makedirs(os.path.join(self.xml_dir, 'nested'))
+        shutil.copy(CAMEL_CONTEXT, os.path.join(self.xml_dir, 'first.xml'))
+        shutil.copy(CAMEL_CONTEXT, os.path.join(self.xml_dir, 'nested', 'second.xml'))
+
+    def batch_args(self, **kwargs):
+        args = build_arg_parser().parse_args(['--xml-dir', self.xml_dir, '--output-dir', self.output_dir,
+                                              '--workers', '2'])
+        vars(args).update(kwargs)
+        return args
+
+    def test_batch_directory(self):
+        self.assertEqual(run_batch(self.batch_args()), 0)
+        with open(EXPECTED_DSL, "r") as expected:
+            expected = expected.read()
+        for name in ('first.java', os.path.join('nested', 'second.java')):
+            with open(os.path.join(self.output_dir, name), "r") as output:
+                self.assertEqual(output.read(), expected)
+
+        with open(os.path.join(self.output_dir, 'summary.json'), "r") as summary:
+            summary = json.load(summary)
+        self.assertEqual(summary['succeeded'], 2)
+        self.assertEqual(summary['failed'], 0)
+
+    def test_batch_reports_failures(self):
+        with open(os.path.join(self.xml_dir, 'broken.xml'), "w") as broken:
+            broken.write('<beans><camelContext')
+
+        self.assertEqual(run_batch(self.batch_args()), 1)
+        with open(os.path.join(self.output_dir, 'summary.json'), "r") as summary:
+            summary = json.load(summary)
+        self.assertEqual(summary['succeeded'], 2)
+        self.assertEqual([r['xml'] for r in summary['results'] if not r['ok']],
+                         [os.path.join(self.xml_dir, 'broken.xml')])
+
+    def test_batch_archives(self):
+        with zipfile.ZipFile(os.path.join(self.xml_dir, 'app.war'), 'w') as archive:
+            archive.write(CAMEL_CONTEXT, 'WEB-INF/classes/camel-context.xml')
+            archive.writestr('META-INF/maven/pom.xml', '<project/>')
+        self.assertEqual(run_batch(self.batch_args()), 0)
+        with open(os.path.join(self.output_dir, 'summary.json'), "r") as summary:
+            summary = json.load(summary)
+        self.assertEqual(summary['succeeded'], 3)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'app.war', 'WEB-INF', 'classes',
+                                                    'camel-context.java')))
+
+    def test_batch_glob(self):
+        pattern = os.path.join(self.xml_dir, '**', '*.xml')
+        self.assertEqual(run_batch(self.batch_args(xml_dir=None, glob=pattern)), 0)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'nested', 'second.java')))
+
+    def test_batch_targets(self):
+        self.assertEqual(run_batch(self.batch_args(target=['java', 'yaml'])), 0)
+        with open(os.path.join(self.output_dir, 'first.camel.yaml')) as output:
+            self.assertIn('\n- route:\n', output.read())
+        with open(os.path.join(self.output_dir, 'summary.json')) as summary:
+            outputs = [result['outputs'] for result in json.load(summary)['results']]
+        self.assertEqual(outputs[0], [os.path.join(self.output_dir, 'first' + suffix)
+                                      for suffix in ('.java', '.camel.yaml')])
+
+        # every target is translated from a single parse
+        output = os.path.join(self.tmp, 'single', 'first')
+        with mock.patch('xml2dsl.xml2dsl.parse_document', wraps=parse_document) as parse:
+            result = convert_file(CAMEL_CONTEXT, output, self.batch_args(target=['java', 'yaml']))
+        self.assertEqual((parse.call_count, result['outputs']), (1, [output + '.java', output + '.camel.yaml']))
+        with open(output + '.java') as java, open(EXPECTED_DSL) as expected:
+            self.assertEqual(java.read(), expected.read())
+
+
+
+class TestServer(unittest.TestCase):
+
+    def test_requests(self):
+        with open(CAMEL_CONTEXT, "r") as xml:
+            inline = xml.read()
+        requests = [
+            {'id': 1, 'path': CAMEL_CONTEXT},
+            {'id': 2, 'xml': inline, 'options': {'stream': True}},
+            {'id': 3, 'xml': inline.replace('<inOnly', '<unknown')},
+            {'id': 4, 'path': CAMEL_CONTEXT, 'options': {'output_dir': '/tmp'}}
+        ]
+        reader = io.StringIO(''.join(json.dumps(request) + '\n' for request in requests))
+        writer = io.StringIO()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            handle_stream(reader, writer, executor, build_arg_parser().parse_args([]))
+
+        responses = {r['id']: r for r in map(json.loads, writer.getvalue().splitlines())}
+        with open(EXPECTED_DSL, "r") as expected:
+            expected = expected.read()
+        self.assertEqual(responses[1]['java'], expected)
+        self.assertEqual(responses[2]['java'], expected)
+        self.assertFalse(responses[3]['ok'])
+        self.assertEqual(responses[3]['diagnostics'][0]['line'], 183)
+        self.assertIn('unsupported option output_dir', responses[4]['error'])
+
+
+class TestStartup(unittest.TestCase):
+    # seconds on top of a bare interpreter start, generous so that slow CI machines do not flake
+    IMPORT_BUDGET = 0.5
+    CONVERSION_BUDGET = 1.0
+
+    ONE_ROUTE = '''<beans xmlns="http://www.springframework.org/schema/beans">
+    <camelContext id="one" xmlns="http://camel.apache.org/schema/spring">
+        <route id="r1">
+            <from uri="direct:start"/>
+            <log message="${body}"/>
+        </route>
+    </camelContext>
+</beans>'''
+
+    @staticmethod
+    def run_python(*args):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable] + list(args), check=True, capture_output=True, text=True)
+        return time.perf_counter() - start, output
+
+    def loaded_modules(self, code):
+        _, output = self.run_python('-c', code + '; print(" ".join(sys.modules))')
+        return set(output.stdout.split())
+
+    def test_import_is_lazy(self):
+        bare, _ = self.run_python('-c', 'pass')
+        elapsed, _ = self.run_python('-c', 'import xml2dsl.xml2dsl')
+        self.assertLess(elapsed - bare, self.IMPORT_BUDGET)
+
+        modules = self.loaded_modules('import sys, xml2dsl.xml2dsl')
+        for module in ('rich', 'configargparse', 'importlib.metadata'):
+            self.assertNotIn(module, modules)
+
+    def test_one_route_conversion(self):
+        tmp = temporary_directory(self)
+        xml = os.path.join(tmp, 'one.xml')
+        with open(xml, "w") as one:
+            one.write(self.ONE_ROUTE)
+        args = ['--xml', xml, '--quiet', '--output', os.path.join(tmp, 'One.java')]
+
+        bare, _ = self.run_python('-c', 'pass')
+        elapsed, _ = self.run_python('-m', 'xml2dsl.xml2dsl', *args)
+        self.assertLess(elapsed - bare, self.CONVERSION_BUDGET)
+
+        modules = self.loaded_modules(f'import sys, xml2dsl.xml2dsl; sys.argv[1:] = {args!r}; xml2dsl.xml2dsl.main()')
+        self.assertNotIn('rich', modules)
+        self.assertNotIn('importlib.metadata', modules)
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()